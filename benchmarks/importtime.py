@@ -0,0 +1,52 @@
+"""Checks the import-time budget of the terms2lod package.
+
+Runs ``python -X importtime -c "import terms2lod"`` in a fresh interpreter
+and fails if the cumulative import time exceeds the budget or if one of the
+heavy dependencies is imported eagerly.
+
+    python benchmarks/importtime.py --budget 500
+"""
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+#dependencies that must only be imported by the functions using them
+LAZY = ("stanza", "torch", "pandas", "numpy", "tabulate", "openpyxl", 
+        "concurrent.futures")
+#budget for `import terms2lod`, in milliseconds
+BUDGET_MS = 500
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+def import_times(module="terms2lod", repeat=3):
+    #cumulative import time (us) of every module, best of `repeat` runs
+    best = dict()
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-X", "importtime", "-c", 
+                              f"import {module}"],
+                             cwd=ROOT, capture_output=True, text=True, check=True)
+        for line in out.stderr.splitlines():
+            m = LINE.match(line)
+            if m:
+                name, cumulative = m.group(4), int(m.group(2))
+                best[name] = min(best.get(name, cumulative), cumulative)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget", type=float, default=BUDGET_MS, 
+                        help="budget for `import terms2lod`, in milliseconds")
+    args = parser.parse_args()
+    times = import_times()
+    total = times["terms2lod"] / 1000
+    eager = [m for m in LAZY if m in times]
+    print(f"import terms2lod: {total:.1f} ms (budget {args.budget:.0f} ms)")
+    if eager:
+        print("eagerly imported:", ", ".join(eager))
+    if total > args.budget or eager:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
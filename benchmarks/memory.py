@@ -0,0 +1,88 @@
+"""Memory footprint of the termbase entities over scaled CLiC-IT 2023 data.
+
+Encodes the scaled termtable into its lexical entries (the objects a
+``Lexicon`` holds before serialization) and reports the memory they retain,
+measured with tracemalloc. With ``--compare`` the same measure is run on the
+``terms2lod`` package of another git revision, to show the difference:
+
+    python benchmarks/memory.py --scales 1 10 --compare HEAD~1
+"""
+import os
+import gc
+import sys
+import json
+import argparse
+import tempfile
+import tracemalloc
+import subprocess
+
+import run
+
+def retained(data):
+    #Bytes retained by the entries encoded from the termtable of data
+    from terms2lod.conversion import encode_entries
+    df = data.df
+    gc.collect()
+    tracemalloc.start()
+    entries = list(encode_entries(df))
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"entries": len(entries), "retained_bytes": current,
+            "peak_bytes": peak}
+
+def measure(workdir, scales, seed=0):
+    results = list()
+    for factor in scales:
+        result = retained(run.Data(workdir, factor, seed))
+        result["scale"] = factor
+        results.append(result)
+    return results
+
+def measure_revision(revision, workdir, scales, seed=0):
+    #Runs the measure in a new process, on the package of the given revision
+    tree = tempfile.mkdtemp(prefix="terms2lod_memory_")
+    archive = subprocess.run(["git", "archive", revision, "terms2lod"],
+                             cwd=run.ROOT, capture_output=True, check=True)
+    subprocess.run(["tar", "-x", "-C", tree], input=archive.stdout, check=True)
+    command = [sys.executable, os.path.abspath(__file__), "--tree", tree,
+               "--workdir", workdir, "--seed", str(seed), "--json",
+               "--scales"] + [str(s) for s in scales]
+    output = subprocess.run(command, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--workdir", help="where the scaled data is kept "
+                        "(default: a temporary directory)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compare", metavar="REVISION",
+                        help="also measure the package of this git revision")
+    parser.add_argument("--tree", help=argparse.SUPPRESS)
+    parser.add_argument("--json", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.tree:
+        sys.path.insert(0, args.tree)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="terms2lod_bench_")
+    os.environ.setdefault("TERMS2LOD_CACHE", os.path.join(workdir, "cache"))
+    #the scaled data is generated here, not in the process of the revision
+    for factor in args.scales:
+        run.Data(workdir, factor, args.seed)
+    if args.compare:
+        before = measure_revision(args.compare, workdir, args.scales, args.seed)
+    results = measure(workdir, args.scales, args.seed)
+    if args.json:
+        print(json.dumps(results))
+        return
+    for i, result in enumerate(results):
+        size = result["retained_bytes"]
+        line = (f"x{result['scale']:<5} {result['entries']:>8} entries "
+                f"{size / 2**20:8.1f} MiB {size / result['entries']:8.0f} B/entry")
+        if args.compare:
+            old = before[i]["retained_bytes"]
+            line += f"   {args.compare}: {old / 2**20:8.1f} MiB ({size / old - 1:+.0%})"
+        print(line)
+
+if __name__ == "__main__":
+    main()
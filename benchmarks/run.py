@@ -0,0 +1,280 @@
+"""Benchmark suite of the terms2lod pipeline over scaled CLiC-IT 2023 data.
+
+The doccano export, the final termtables and the termbase are replicated
+10x, 100x, ... by ``benchmarks/scale.py`` and every stage is timed (wall
+clock) and, in a second run under tracemalloc, measured for peak Python
+memory. stanza is replaced by a stub, so the suite runs offline and times
+only our side of ``jsonl2termtable``. Results are written as JSON:
+
+    python benchmarks/run.py --scales 1 10 100 --output bench.json
+    python benchmarks/run.py --scales 1000 --stages termtable2ontolex doccano2nif
+"""
+import os
+import io
+import sys
+import json
+import time
+import types
+import random
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+from contextlib import redirect_stdout
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA = os.path.join(ROOT, "CLiC-IT 2023 data")
+JSONL = os.path.join(DATA, "doccano", "annot1_corpus.jsonl")
+ENTRIES = os.path.join(DATA, "termtables", "final_termbase_entries.xlsx")
+FORMS = os.path.join(DATA, "termtables", "final_termbase_forms.xlsx")
+TERMBASE = os.path.join(DATA, "final corpus", "termbase.ttl")
+BASE = "https://example.com/"
+COLLECTION = BASE + "corpus"
+ANNOTATOR = BASE + "annotators/annot1"
+
+sys.path.insert(0, ROOT)
+import scale
+
+
+def stub_stanza():
+    #Offline stand-in for stanza: every term is one sentence headed by its
+    #first word, lemmatized as itself
+    class Word:
+        def __init__(self, text, i):
+            self.text, self.lemma, self.upos, self.feats = text, text, "NOUN", ""
+            self.head = 0 if i == 0 else 1
+    class Sentence:
+        def __init__(self, text):
+            self.words = [Word(t, i) for i, t in enumerate(text.split())]
+    class Document:
+        def __init__(self, sentences, text=""):
+            self.text, self.sentences = text, sentences
+    class Pipeline:
+        def __init__(self, **kwargs):
+            self.kwargs = kwargs
+        def __call__(self, docs):
+            for doc in docs:
+                doc.sentences = [Sentence(doc.text)]
+            return docs
+    stanza = types.ModuleType("stanza")
+    stanza.__version__ = "stub"
+    stanza.Pipeline, stanza.Document = Pipeline, Document
+    resources = types.ModuleType("stanza.resources")
+    common = types.ModuleType("stanza.resources.common")
+    common.DEFAULT_RESOURCES_VERSION = "stub"
+    stanza.resources, resources.common = resources, common
+    sys.modules.update({"stanza": stanza, "stanza.resources": resources,
+                        "stanza.resources.common": common})
+
+
+class Data():
+    #Scaled copies of the data, generated once per scale in the work directory
+    def __init__(self, workdir, factor, seed=0):
+        self.dir = os.path.join(workdir, f"x{factor}")
+        self.factor = factor
+        self.jsonl = os.path.join(self.dir, "corpus.jsonl")
+        self.entries = os.path.join(self.dir, "entries.csv")
+        self.forms = os.path.join(self.dir, "forms.csv")
+        self.termbase = os.path.join(self.dir, "termbase.nt")
+        if not os.path.exists(self.termbase):
+            os.makedirs(self.dir, exist_ok=True)
+            scale.scale_jsonl(JSONL, self.jsonl, factor, seed)
+            scale.scale_termtable(ENTRIES, self.entries, factor)
+            scale.scale_termtable(FORMS, self.forms, factor)
+            scale.scale_termbase(TERMBASE, self.termbase, factor)
+        self.seed = seed
+        self._docs = self._df = None
+
+    def out(self, name):
+        return os.path.join(self.dir, name)
+
+    @property
+    def docs(self):
+        if self._docs is None:
+            from terms2lod.terms2lod import read_jsonl
+            self._docs = list(read_jsonl(self.jsonl))
+        return self._docs
+
+    @property
+    def df(self):
+        if self._df is None:
+            from terms2lod.termtables import load_termtable
+            self._df = load_termtable(self.entries, self.forms)
+        return self._df
+
+
+#Every stage gets the data, does its setup and returns the function to
+#measure, which returns the number of items it processed
+STAGES = dict()
+
+def stage(name):
+    def register(setup):
+        STAGES[name] = setup
+        return setup
+    return register
+
+@stage("json2annotations")
+def bench_json2annotations(data):
+    from terms2lod.terms2lod import json2annotations
+    docs = data.docs
+    return lambda: sum(len(json2annotations(doc)) for doc in docs)
+
+@stage("jsonl2termtable")
+def bench_jsonl2termtable(data):
+    from terms2lod.terms2lod import jsonl2termtable
+    def run():
+        jsonl2termtable(data.jsonl, data.out("termtable.xlsx"), "it",
+                        parse_cache=False)
+        return len(data.docs)
+    return run
+
+@stage("termtable2ontolex")
+def bench_termtable2ontolex(data):
+    #one entry per group of the termtable
+    from terms2lod.conversion import termtable2ontolex, group_indices
+    n_entries = len(group_indices(data.df))
+    def run():
+        termtable2ontolex(data.out("termbase_stream.nt"), data.entries,
+                          data.forms, format="nt", stream=True)
+        return n_entries
+    return run
+
+@stage("termtable2ontolex[workers]")
+def bench_parallel(data):
+    #one worker per core, sorted N-Triples output
+    from terms2lod.conversion import termtable2ontolex
+    def run():
+        termtable2ontolex(data.out("termbase_parallel.nt"), data.entries,
+                          data.forms, format="nt", 
+                          workers=max(os.cpu_count() or 1, 2))
+        return len(data.df)
+    return run
+
+@stage("termtable2ontolex[incremental]")
+def bench_incremental(data):
+    #rebuild of an unchanged termbase from the state of a previous run
+    from terms2lod.conversion import termtable2ontolex
+    out = data.out("termbase_incremental.nt")
+    termtable2ontolex(out, data.entries, data.forms, format="nt",
+                      incremental=True)
+    def run():
+        termtable2ontolex(out, data.entries, data.forms, format="nt",
+                          incremental=True)
+        return len(data.df)
+    return run
+
+@stage("Lexicon.serialize")
+def bench_serialize(data):
+    from terms2lod import dataclasses
+    from terms2lod.conversion import encode_entries, BASE
+    lexicon = dataclasses.Lexicon(BASE + "lexicon", list(encode_entries(data.df)),
+                                  "Italian")
+    return lambda: len(lexicon.serialize())
+
+@stage("add_variants")
+def bench_add_variants(data):
+    from terms2lod import dataclasses
+    from terms2lod.conversion import encode_entries, add_variants, BASE
+    lexicon = dataclasses.Lexicon(BASE + "lexicon", list(encode_entries(data.df)),
+                                  "Italian")
+    graph = lexicon.serialize()
+    n_triples = len(graph)
+    return lambda: len(add_variants(graph)) - n_triples
+
+@stage("doccano2nif")
+def bench_doccano2nif(data):
+    from terms2lod.doccano2nif import doccano2nif
+    out = data.out("corpus.nt")
+    def run():
+        with redirect_stdout(io.StringIO()):
+            doccano2nif(out, data.jsonl, COLLECTION, data.forms, data.entries,
+                        BASE + "termbase/", ANNOTATOR, stream=True)
+        return len(data.docs)
+    return run
+
+@stage("eval.gold_standard")
+def bench_gold_standard(data):
+    #extraction of the gold terms from the scaled termbase, without the cache
+    from terms2lod import eval
+    return lambda: len(eval.extract_gold(data.termbase))
+
+@stage("eval.evaluate")
+def bench_evaluate(data):
+    #a ranked list made of the scaled forms, shuffled and half replaced
+    #by noise, against the (cached) gold standard
+    from terms2lod import eval
+    rng = random.Random(data.seed)
+    predicted = list(data.df.form.unique())
+    predicted = [t if rng.random() < 0.5 else f"noise {i}"
+                 for i, t in enumerate(predicted)]
+    rng.shuffle(predicted)
+    eval.gold_standard(data.termbase)
+    def run():
+        with redirect_stdout(io.StringIO()):
+            eval.evaluate(predicted, data.termbase)
+        return len(predicted)
+    return run
+
+
+def measure(setup, data, memory=True):
+    run = setup(data)
+    start = time.perf_counter()
+    items = run()
+    result = {"seconds": time.perf_counter() - start, "items": items}
+    if memory:
+        run = setup(data)
+        tracemalloc.start()
+        run()
+        result["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES),
+                        default=list(STAGES))
+    parser.add_argument("--workdir", help="where the scaled data is kept "
+                        "(default: a temporary directory)")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip the tracemalloc run of every stage")
+    parser.add_argument("--real-stanza", action="store_true",
+                        help="use the installed stanza models instead of the stub")
+    args = parser.parse_args()
+    workdir = args.workdir or tempfile.mkdtemp(prefix="terms2lod_bench_")
+    #keep the caches of the runs out of the user cache
+    os.environ.setdefault("TERMS2LOD_CACHE", os.path.join(workdir, "cache"))
+    if not args.real_stanza:
+        stub_stanza()
+    results = list()
+    for factor in args.scales:
+        data = Data(workdir, factor, args.seed)
+        for name in args.stages:
+            result = measure(STAGES[name], data, not args.no_memory)
+            result.update(stage=name, scale=factor)
+            results.append(result)
+            peak = result.get("peak_bytes")
+            peak = f"{peak / 2**20:8.1f} MiB" if peak is not None else ""
+            print(f"x{factor:<5} {name:<32} {result['seconds']:9.3f} s {peak}")
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "stanza": "real" if args.real_stanza else "stub",
+        "results": results
+    }
+    with open(args.output, "w") as fileout:
+        json.dump(report, fileout, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Synthetic scaler for the CLiC-IT 2023 data.
+
+Replicates the doccano exports, the final termtables and the termbase
+``factor`` times. Replica 0 is the original data; the other replicas are
+perturbed so that they are not plain duplicates:
+
+* documents get new ids and lose a random tenth of their entities (and the
+  relations touching them);
+* terms get a replica tag appended to every lemma, form, concept and
+  subterm, so that each replica adds new entries to the termbase;
+* the termbase gets the same tag on the local names of its URIs and on the
+  written representations of its forms.
+"""
+import json
+import codecs
+import random
+import string
+
+EXAMPLE_BASE = "https://example.com/"
+TAGGED_COLUMNS = ("form", "lemma", "concept")
+
+def replica_tag(k):
+    #'' for the original data, then 'qb', 'qc', ... 'qba', ...
+    if k == 0:
+        return ""
+    letters = ""
+    while k:
+        k, r = divmod(k, 26)
+        letters = string.ascii_lowercase[r] + letters
+    return "q" + letters
+
+def scale_jsonl(src, dst, factor, seed=0):
+    rng = random.Random(seed)
+    with codecs.open(src, "r", "utf8") as filein:
+        docs = [json.loads(line) for line in filein if line.strip()]
+    max_id = max(e["id"] for d in docs for e in d["entities"]) + 1
+    max_doc = max(d["id"] for d in docs) + 1
+    with codecs.open(dst, "w", "utf8") as fileout:
+        for k in range(factor):
+            for doc in docs:
+                entities = doc["entities"]
+                if k:
+                    entities = [e for e in entities if rng.random() >= 0.1]
+                kept = {e["id"] for e in entities}
+                relations = [r for r in doc["relations"]
+                             if r["from_id"] in kept and r["to_id"] in kept]
+                offset = k * max_id
+                replica = dict(doc)
+                replica["id"] = doc["id"] + k * max_doc
+                replica["entities"] = [dict(e, id=e["id"] + offset)
+                                       for e in entities]
+                replica["relations"] = [dict(r, from_id=r["from_id"] + offset,
+                                             to_id=r["to_id"] + offset)
+                                        for r in relations]
+                fileout.write(json.dumps(replica, ensure_ascii=False) + "\n")
+
+def scale_termtable(src, dst, factor):
+    import pandas as pd
+    df = pd.read_excel(src) if src.endswith(".xlsx") else pd.read_csv(src, dtype=str)
+    replicas = list()
+    for k in range(factor):
+        tag = replica_tag(k)
+        replica = df.copy()
+        for column in TAGGED_COLUMNS:
+            if column in replica:
+                replica[column] = replica[column].where(replica[column].isna(),
+                                                        replica[column] + tag)
+        if "subterms" in replica:
+            replica["subterms"] = replica["subterms"].map(
+                lambda s: s if not isinstance(s, str) else
+                "; ".join(t.strip() + tag for t in s.split(";")))
+        replicas.append(replica)
+    pd.concat(replicas).to_csv(dst, index=False)
+
+def scale_termbase(src, dst, factor, base=EXAMPLE_BASE):
+    from rdflib import Graph, Literal, URIRef
+    from rdflib.namespace import Namespace
+    ontolex = Namespace("http://www.w3.org/ns/lemon/ontolex#")
+    graph = Graph()
+    graph.parse(src)
+    def tagged(term, tag):
+        if isinstance(term, URIRef) and term.startswith(base):
+            return URIRef(term + tag)
+        return term
+    with codecs.open(dst, "w", "utf8") as fileout:
+        for k in range(factor):
+            tag = replica_tag(k)
+            for s, p, o in graph:
+                o = tagged(o, tag)
+                if p == ontolex.writtenRep:
+                    o = Literal(str(o) + tag, lang=o.language)
+                fileout.write(f"{tagged(s, tag).n3()} {p.n3()} {o.n3()} .\n")
@@ -1,3 +1,5 @@
-from .terms2lod import jsonl2counter, term_table
+#Heavy dependencies (stanza, pandas, tabulate) are imported by the functions 
+#that need them, so importing the package only loads rdflib and pynif
+from .terms2lod import jsonl2termtable
 from .doccano2nif import doccano2nif
-from .conversion import termtable2ontolex
\ No newline at end of file
+from .conversion import termtable2ontolex, Converter
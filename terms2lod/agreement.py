@@ -0,0 +1,222 @@
+import json
+from array import array
+from dataclasses import dataclass, field
+from itertools import combinations
+from . import instrument
+from .terms2lod import get_terms, read_jsonl, TermTrie
+
+
+def term_span(term):
+    phrases = term[2]
+    return min(p.begin for p in phrases), max(p.end for p in phrases)
+
+def only_longest(terms):
+    #Drops the terms whose span is nested in the span of another term
+    spans = sorted({term_span(t) for t in terms}, key=lambda x: (x[0], -x[1]))
+    nested, max_end = set(), -1
+    for b, e in spans:
+        if max_end >= e:
+            nested.add((b, e))
+        max_end = max(max_end, e)
+    return [t for t in terms if term_span(t) not in nested]
+
+def bag(docs, terms, n_terms):
+    #Sorted (document, term) keys of the terms of an annotator, with counts
+    import numpy as np
+    docs = np.frombuffer(docs, dtype=np.int64)
+    terms = np.frombuffer(terms, dtype=np.int64)
+    return np.unique(docs * n_terms + terms, return_counts=True)
+
+def pair_counts(bags, pairs, n_docs, n_terms):
+    #(documents, pairs, 3) tp/fp/fn counts of each pair of annotators, from
+    #their bags: the tp of a term are the occurrences both annotators gave
+    import numpy as np
+    result = np.zeros((n_docs, len(pairs), 3), dtype=np.int64)
+    totals = [np.bincount(keys // n_terms, weights=n, minlength=n_docs)
+              for keys, n in bags]
+    for p, (i, j) in enumerate(pairs):
+        (keys_i, n_i), (keys_j, n_j) = bags[i], bags[j]
+        common, a, b = np.intersect1d(keys_i, keys_j, assume_unique=True,
+                                      return_indices=True)
+        tp = np.bincount(common // n_terms, weights=np.minimum(n_i[a], n_j[b]),
+                         minlength=n_docs)
+        result[:, p, 0] = tp
+        result[:, p, 1] = totals[i] - tp
+        result[:, p, 2] = totals[j] - tp
+    return result
+
+def f1_score(counts):
+    #F1 from an array of (tp, fp, fn) counts, 0 when there are no terms
+    import numpy as np
+    counts = np.asarray(counts, dtype=float)
+    tp, fp, fn = counts[..., 0], counts[..., 1], counts[..., 2]
+    denominator = 2 * tp + fp + fn
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(denominator > 0, 2 * tp / denominator, 0.0)
+
+def fleiss_kappa(table):
+    #Fleiss' kappa of an (items, categories) table of rating counts
+    import numpy as np
+    table = np.asarray(table, dtype=float)
+    if not len(table):
+        return float("nan")
+    n_items, n_raters = table.shape[0], table[0].sum()
+    p_j = table.sum(axis=0) / (n_items * n_raters)
+    p_i = ((table ** 2).sum(axis=1) - n_raters) / (n_raters * (n_raters - 1))
+    p_e = (p_j ** 2).sum()
+    return (p_i.mean() - p_e) / (1 - p_e)
+
+
+@dataclass
+class Agreement():
+    annotators: list
+    pairs: list
+    #(documents, pairs, 3) tp/fp/fn counts of the terms of each document
+    doc_counts: object = field(repr=False)
+    #(pairs, 3) counts over the corpus of the subterm-expanded terms
+    expanded_counts: object = field(repr=False)
+    categories: list = field(repr=False)
+    #(items, categories) domains given to the spans annotated by everybody
+    domain_table: object = field(repr=False)
+    #ids of the documents of each export missing from some other export
+    unmatched: list = field(default_factory=list)
+
+    @property
+    def doc_f1(self):
+        return f1_score(self.doc_counts)
+
+    @property
+    def corpus_f1(self):
+        return f1_score(self.doc_counts.sum(axis=0))
+
+    @property
+    def expanded_f1(self):
+        return f1_score(self.expanded_counts)
+
+    @property
+    def kappa(self):
+        return fleiss_kappa(self.domain_table)
+
+
+def index_export(jsonl_file):
+    #Byte offsets of the documents of an export, by doccano id and by hash
+    #of the text, and the (offset, id) of every document
+    by_id, by_text, documents = dict(), dict(), list()
+    offset = 0
+    with open(jsonl_file, "rb") as filein:
+        for line in filein:
+            if line.strip():
+                doc = json.loads(line)
+                by_id.setdefault(doc["id"], offset)
+                by_text.setdefault(hash(doc["text"]), offset)
+                documents.append((offset, doc["id"]))
+            offset += len(line)
+    return by_id, by_text, documents
+
+def align_documents(jsonl_files, unmatched=None):
+    #Yields the versions of the same document in each export, matched by 
+    #doccano id or, when the id is missing, by text. The first export is 
+    #streamed; the others are only indexed by offset and their matched 
+    #documents read on the way. At the end, the ids of the documents of each
+    #export left unmatched are appended to the unmatched list
+    indexes = [index_export(f) for f in jsonl_files[1:]]
+    files = [open(f, "rb") for f in jsonl_files[1:]]
+    used = [set() for _ in indexes]
+    first = list()
+    try:
+        for doc in read_jsonl(jsonl_files[0]):
+            versions, offsets = [doc], list()
+            for (by_id, by_text, _), filein, u in zip(indexes, files, used):
+                offset = by_id.get(doc["id"])
+                if offset is None:
+                    offset = by_text.get(hash(doc["text"]))
+                if offset is None or offset in u:
+                    break
+                filein.seek(offset)
+                other = json.loads(filein.readline())
+                if other["id"] != doc["id"] and other["text"] != doc["text"]:
+                    break
+                versions.append(other)
+                offsets.append(offset)
+            else:
+                for offset, u in zip(offsets, used):
+                    u.add(offset)
+                yield versions
+                continue
+            first.append(doc["id"])
+    finally:
+        for filein in files:
+            filein.close()
+    if unmatched is not None:
+        unmatched.append(first)
+        for (_, _, documents), u in zip(indexes, used):
+            unmatched.append([i for offset, i in documents if offset not in u])
+
+def agreement(jsonl_files, vocabulary=None, longest=True, strict=False):
+    #Agreement between the annotators of two or more doccano exports of the
+    #same documents, aligned by id in one streaming pass over the first 
+    #export. With a vocabulary (e.g. the forms of the termbase) the terms are
+    #also expanded with their subterms and restricted to the vocabulary, as 
+    #in the subterm-expanded F1. The terms are collected as arrays of ids and
+    #counted at the end. Only the documents found in every export are 
+    #compared; the others are reported in Agreement.unmatched, or raise a 
+    #ValueError if strict
+    import numpy as np
+    n_files = len(jsonl_files)
+    pairs = list(combinations(range(n_files), 2))
+    trie = TermTrie(vocabulary) if vocabulary is not None else None
+    vocabulary = set(vocabulary) if vocabulary is not None else None
+    term_ids, subterm_ids, categories = dict(), dict(), dict()
+    #(document, term) of the terms and of the subterms of every annotator
+    docs = [array("q") for _ in jsonl_files]
+    terms = [array("q") for _ in jsonl_files]
+    subdocs = [array("q") for _ in jsonl_files]
+    subterms = [array("q") for _ in jsonl_files]
+    items = array("q")
+    unmatched = list()
+    n_docs = 0
+    for versions in align_documents(jsonl_files, unmatched):
+        annotations = list()
+        for doc in versions:
+            found, _ = get_terms(doc)
+            annotations.append(only_longest(found) if longest else found)
+        for k, found in enumerate(annotations):
+            for t in found:
+                term = term_ids.setdefault(t[0], len(term_ids))
+                docs[k].append(n_docs)
+                terms[k].append(term)
+                if trie is None:
+                    continue
+                if t[0] not in subterm_ids:
+                    subterm_ids[t[0]] = [term_ids.setdefault(s, len(term_ids))
+                                         for s in trie.find(t[0]) 
+                                         if s in vocabulary]
+                found_ids = subterm_ids[t[0]]
+                subterms[k].extend(found_ids)
+                subdocs[k].extend([n_docs] * len(found_ids))
+        #domain given by every annotator to the spans they all annotated
+        labels = [dict() for _ in annotations]
+        for annotator, found in zip(labels, annotations):
+            for t in found:
+                annotator.setdefault((t[0], term_span(t)), t[1])
+        for key in set(labels[0]).intersection(*labels[1:]):
+            items.extend(categories.setdefault(l[key], len(categories))
+                         for l in labels)
+        n_docs += 1
+    for f, ids in zip(jsonl_files, unmatched):
+        if ids and strict:
+            raise ValueError(f"documents {ids} of '{f}' are not in every export")
+        for i in ids:
+            instrument.event("documents.unmatched", (str(f), i))
+    n_terms = max(len(term_ids), 1)
+    doc_counts = pair_counts([bag(d, t, n_terms) for d, t in zip(docs, terms)],
+                             pairs, n_docs, n_terms)
+    #the subterms are also counted per document, then summed
+    subbags = [bag(d, t, n_terms) for d, t in zip(subdocs, subterms)]
+    expanded = pair_counts(subbags, pairs, n_docs, n_terms).sum(axis=0)
+    items = np.frombuffer(items, dtype=np.int64).reshape(-1, n_files)
+    domain_table = np.zeros((len(items), len(categories)), dtype=np.int64)
+    rows = np.repeat(np.arange(len(items)), items.shape[1])
+    np.add.at(domain_table, (rows, items.ravel()), 1)
+    return Agreement([str(f) for f in jsonl_files], pairs, doc_counts,
+                     expanded, list(categories), domain_table, unmatched)
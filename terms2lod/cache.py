@@ -0,0 +1,154 @@
+import os
+import hashlib
+import sqlite3
+
+CHUNK_SIZE = 1 << 20
+MAX_PARSES = 100000
+SQL_BATCH = 500
+
+PARSES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS parses (term TEXT, lang TEXT, version TEXT,
+                                   head INTEGER, lemma TEXT, upos TEXT, 
+                                   feats TEXT, used INTEGER,
+                                   PRIMARY KEY (term, lang, version)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS parses_used ON parses (used);
+"""
+
+def hash_files(*filenames):
+    #Hash of the content of the files, used to invalidate the caches
+    h = hashlib.sha1()
+    for filename in filenames:
+        with open(filename, "rb") as filein:
+            for chunk in iter(lambda: filein.read(CHUNK_SIZE), b""):
+                h.update(chunk)
+        h.update(b"\0")
+    return h.hexdigest()
+
+def default_cache_dir():
+    #Directory for the on-disk caches: TERMS2LOD_CACHE, else terms2lod in 
+    #XDG_CACHE_HOME (~/.cache). Read at every call, so it can be set at runtime
+    if os.environ.get("TERMS2LOD_CACHE"):
+        return os.environ["TERMS2LOD_CACHE"]
+    xdg = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache")
+    return os.path.join(xdg, "terms2lod")
+
+def cache_path(name, cache_dir=None):
+    cache_dir = default_cache_dir() if cache_dir is None else cache_dir
+    os.makedirs(cache_dir, exist_ok=True)
+    return os.path.join(cache_dir, name)
+
+
+class ParseCache():
+    #Persistent cache of parsed terms keyed by (term, language, model version),
+    #bounded to max_entries with least-recently-used eviction
+    def __init__(self, filename=None, max_entries=MAX_PARSES, cache_dir=None):
+        if filename is None:
+            filename = cache_path("parses.sqlite", cache_dir)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(filename)
+        self.connection.executescript(PARSES_SCHEMA)
+        self.clock = self.connection.execute(
+            "SELECT COALESCE(MAX(used), 0) FROM parses").fetchone()[0]
+
+    def __repr__(self):
+        return f"ParseCache(hits={self.hits}, misses={self.misses})"
+
+    def get_many(self, terms, lang, version):
+        #{term: (head, lemma, upos, feats)} for the cached terms
+        self.clock += 1
+        found = dict()
+        terms = list(terms)
+        for start in range(0, len(terms), SQL_BATCH):
+            batch = terms[start:start + SQL_BATCH]
+            marks = ", ".join("?" * len(batch))
+            rows = self.connection.execute(
+                "SELECT term, head, lemma, upos, feats FROM parses "
+                f"WHERE lang = ? AND version = ? AND term IN ({marks})",
+                (lang, version, *batch))
+            for term, *parse in rows:
+                found[term] = tuple(parse)
+            self.connection.execute(
+                f"UPDATE parses SET used = ? WHERE lang = ? AND version = ? "
+                f"AND term IN ({marks})", (self.clock, lang, version, *batch))
+        self.connection.commit()
+        self.hits += len(found)
+        self.misses += len(terms) - len(found)
+        return found
+
+    def put_many(self, parses, lang, version):
+        self.clock += 1
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO parses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            ((term, lang, version, *parse, self.clock) 
+             for term, parse in parses.items()))
+        self.evict()
+        self.connection.commit()
+
+    def evict(self):
+        n = self.connection.execute("SELECT COUNT(*) FROM parses").fetchone()[0]
+        if n > self.max_entries:
+            self.connection.execute(
+                "DELETE FROM parses WHERE (term, lang, version) IN "
+                "(SELECT term, lang, version FROM parses ORDER BY used LIMIT ?)",
+                (n - self.max_entries,))
+
+    def close(self):
+        self.connection.close()
+
+
+BUILD_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS groups (key TEXT PRIMARY KEY, fingerprint TEXT,
+                                   concept TEXT, sense TEXT, chunk TEXT,
+                                   triples INTEGER, shared TEXT) WITHOUT ROWID;
+"""
+
+class BuildState():
+    #Fingerprint and rendered chunk of every group of a termtable, kept from
+    #one conversion to the next. The state is dropped when the settings it 
+    #was rendered with (format, base URI, ...) change
+    def __init__(self, filename, settings):
+        self.connection = sqlite3.connect(filename)
+        self.connection.executescript(BUILD_SCHEMA)
+        stored = dict(self.connection.execute("SELECT key, value FROM meta"))
+        settings = {k: str(v) for k, v in settings.items()}
+        if stored != settings:
+            #the groups table is recreated, its columns may have changed
+            self.connection.execute("DROP TABLE groups")
+            self.connection.execute("DELETE FROM meta")
+            self.connection.executescript(BUILD_SCHEMA)
+            self.connection.executemany("INSERT INTO meta VALUES (?, ?)",
+                                        settings.items())
+            self.connection.commit()
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM groups").fetchone()[0]
+
+    def fingerprints(self):
+        return dict(self.connection.execute("SELECT key, fingerprint FROM groups"))
+
+    def put_many(self, rows):
+        #rows of (key, fingerprint, concept, sense, chunk, triples, shared),
+        #shared being the JSON list of the [key, chunk, triples] of the 
+        #shared entities of the group
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO groups VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def delete_many(self, keys):
+        self.connection.executemany("DELETE FROM groups WHERE key = ?",
+                                    ((k,) for k in keys))
+
+    def get(self, key):
+        #(concept, sense, chunk, triples, shared) of a group
+        return self.connection.execute(
+            "SELECT concept, sense, chunk, triples, shared FROM groups "
+            "WHERE key = ?", (key,)).fetchone()
+
+    def commit(self):
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
@@ -1,8 +1,14 @@
+import os
 import re
+import json
+import heapq
 import codecs
-import pandas as pd
-from . import dataclasses
-from rdflib import  RDF, Namespace
+import shutil
+from . import dataclasses, writers, instrument
+from .termtables import load_termtable
+from .lookup import TermIndex
+from .cache import BuildState
+from rdflib import Namespace, URIRef
 
 ONTOLEX = Namespace("http://www.w3.org/ns/lemon/ontolex#")
 LEXINFO = Namespace("http://www.lexinfo.net/ontology/2.0/lexinfo#")
@@ -16,93 +22,564 @@ subject_dict = {
     "Other": "Other"
 }
 
-BASE = "https://example.com/"
-
-def set_uri(uri):
-    global BASE
-    BASE = uri
+DEFAULT_BASE = "https://example.com/"
+#bumped when the encoding changes, to invalidate the stored build states
+STATE_VERSION = 2
+#chunks of the termtable per worker process, for load balancing
+CHUNKS_PER_WORKER = 4
 
 def parse_feats(feats):
     keys = re.findall("(?:^|\|)(.*?)=", feats)
     values = re.findall("=(.*?)(?:$|\|)", feats)
     return {k:v for k, v in zip(keys, values)}
 
+def _columns(df):
+    #{column: array}, for positional access without building row objects
+    return {c: df[c].to_numpy() for c in df.columns}
+
+def _map_unique(series, function):
+    #Applies the function once per distinct value of the series
+    values = series.unique()
+    return series.map(dict(zip(values, map(function, values))))
+
+VARIANT_MODES = ("cap", "star")
+
+class VariantIndex():
+    #Maps each lexical concept to the senses lexicalizing it, in encoding 
+    #order. Concepts with more than max_variants senses are either capped, 
+    #linking each sense to at most max_variants neighbours, or compressed 
+    #into a star around the first sense
+    def __init__(self, max_variants=None, mode="cap"):
+        if mode not in VARIANT_MODES:
+            raise NotImplementedError(f"unknown variant mode '{mode}'")
+        if max_variants is not None and max_variants < 1:
+            raise ValueError("max_variants must be at least 1")
+        self.max_variants = max_variants
+        self.mode = mode
+        self.senses = dict()
+
+    @classmethod
+    def from_graph(cls, graph, max_variants=None, mode="cap"):
+        index = cls(max_variants, mode)
+        for concept, sense in graph.subject_objects(ONTOLEX.lexicalizedSense):
+            index.add(concept, sense)
+        return index
+
+    def add(self, concept, sense):
+        self.senses.setdefault(concept, dict())[sense] = None
+
+    def add_entry(self, entry):
+        self.add(entry.evokes.uri, entry.evokes.lexicalizedSense.uri)
+
+    def pairs(self):
+        #All the pairs of variants of a concept, within the cap
+        max_variants = self.max_variants
+        for senses in self.senses.values():
+            senses = list(senses)
+            n = len(senses)
+            if max_variants is None or n <= max_variants:
+                for v_1 in senses:
+                    for v_2 in senses:
+                        if v_1 != v_2:
+                            yield v_1, v_2
+            elif self.mode == "star":
+                for v in senses[1:]:
+                    yield senses[0], v
+                    yield v, senses[0]
+            elif max_variants == 1:
+                #a ring would give every sense two neighbours, pairs give one
+                for v_1, v_2 in zip(senses[::2], senses[1::2]):
+                    yield v_1, v_2
+                    yield v_2, v_1
+            else:
+                #ring of n > max_variants senses, each linked to the 
+                #max_variants // 2 following and preceding ones
+                for i, v_1 in enumerate(senses):
+                    for d in range(1, max_variants // 2 + 1):
+                        v_2 = senses[(i + d) % n]
+                        yield v_1, v_2
+                        yield v_2, v_1
+
+    def triples(self):
+        for v_1, v_2 in self.pairs():
+            yield (v_1, LEXINFO.synonym, v_2)
+
+def add_variants(graph, max_variants=None, mode="cap"):
+    index = VariantIndex.from_graph(graph, max_variants, mode)
+    graph.addN((s, p, o, graph) for s, p, o in index.triples())
+    return graph
+
+GROUP_KEYS = ["lemma", "feats_y", "concept", "domain", "IATE"]
+
+def stream_ontolex(filename, lexicon, entries, format="turtle", memo=None,
+                   max_variants=None, variant_mode="cap", prefixes=None):
+    #Writes each entry as soon as it is encoded, without building a graph.
+    #The shared entities are written once, after the first entry using them
+    memo = dataclasses.EmittedCache() if memo is None else memo
+    memo.defer_shared = True
+    variants = VariantIndex(max_variants, variant_mode)
+    n_entries = 0
+    with writers.open_writer(filename, format, prefixes) as writer:
+        for entry in entries:
+            writer.write(lexicon.entry_triples(entry, memo))
+            memo.clear()
+            variants.add_entry(entry)
+            n_entries += 1
+        writer.write(lexicon.info_triples(n_entries))
+        writer.write(variants.triples())
+    instrument.count("triples", writer.written)
+
+def _shared_key(entity):
+    #Key of a shared entity in the build state, as its memo key
+    return " ".join([type(entity).__name__] + 
+                    [str(k) for k in entity.memo_key()[1:]])
+
+def group_indices(df_full):
+    #(key, positions of the rows) of every group of the termtable, in 
+    #encoding order
+    groups = df_full.groupby(GROUP_KEYS)
+    order = groups.ngroup().to_numpy()
+    return sorted(groups.indices.items(), key=lambda x: order[x[1][0]])
+
+def group_fingerprints(df_full):
+    #(key, fingerprint, positions of the rows) of every group, in encoding 
+    #order. The fingerprint hashes all the columns of the rows of the group, 
+    #in their order
+    import hashlib
+    import pandas as pd
+    row_hashes = pd.util.hash_pandas_object(df_full[sorted(df_full.columns)],
+                                            index=False).to_numpy()
+    for key, idx in group_indices(df_full):
+        fingerprint = hashlib.sha1(row_hashes[idx].tobytes()).hexdigest()
+        yield key, fingerprint, idx
+
+def split_groups(df_full, n_chunks):
+    #Splits the termtable into chunks of consecutive groups, in encoding order
+    groups = df_full.groupby(GROUP_KEYS).ngroup()
+    n_groups = groups.max() + 1 if len(groups) else 0
+    chunk_ids = groups * n_chunks // max(n_groups, 1)
+    for i, (_, df_chunk) in enumerate(df_full.groupby(chunk_ids)):
+        yield i, df_chunk
+
+
+
+class Converter():
+    #Conversion of termtables to OntoLex-Lemon. The base URI of the termbase,
+    #the map from domains to DBpedia categories and the namespace bindings of
+    #the output are state of the converter, so that conversions with 
+    #different settings can run concurrently in one process
+    def __init__(self, base=DEFAULT_BASE, subjects=None, namespaces=None,
+                 language="Italian"):
+        self.base = base
+        self.subjects = dict(subject_dict if subjects is None else subjects)
+        #{prefix: namespace} bound in addition to the default ones
+        self.namespaces = namespaces
+        self.language = language
+
+    def __repr__(self):
+        return f"Converter(base={self.base!r})"
+
+    def encode_form(self, form, feats=""):
+        uri_form = self.base + "form_" + re.sub(" ", "_", form)
+        if feats != "":
+            feats = parse_feats(feats)
+        else:
+            feats = {}
+        return dataclasses.Form(uri_form, form, feats)
+
+    def encode_sense(self, lemma, subject):
+        sense_uri = self.base + "sense_" + re.sub(" ", "_", lemma)
+        subject = self.subjects[subject]
+        return dataclasses.LexicalSense(sense_uri, subject)
+
+    def encode_concept(self, concept, subject, sense, ontology_entry):
+        concept_uri = self.base + "concept_" + re.sub(" ", "_", concept)
+        subject = self.subjects[subject]
+        return dataclasses.LexicalConcept(concept_uri, sense, subject,
+                                          ontology_entry)
+
+    def encode_word(self, lemma, pos, sense, concept, forms):
+        entry_uri = self.base + "entry_" + re.sub(" ", "_", lemma.writtenRep)
+        return dataclasses.Word(entry_uri, lemma, pos, sense, concept, forms)
+
+    def encode_mwe(self, lemma, pos, sense, concept, forms, subterms_raw):
+        entry_uri = self.base + "entry_" + re.sub(" ", "_", lemma.writtenRep)
+        words = lemma.writtenRep.split(" ")
+        comps, subterms = list(), list()
+        for w in words:
+            comp_uri = self.base + "component_" + w
+            comps.append(dataclasses.Component(comp_uri))
+        if subterms_raw != "":
+            for s in subterms_raw.split(";"):
+                s = s.strip()
+                s_uri = self.base + "entry_" + re.sub(" ", "_", s)
+                subterms.append(s_uri)
+        return dataclasses.MultiwordExpression(entry_uri, lemma, pos, sense, 
+                                               concept, forms, subterms, comps)
+
+    def encode_entry(self, lemma, pos, sense, concept, forms, subterms_raw):
+        if " " in lemma.writtenRep:
+            return self.encode_mwe(lemma, pos, sense, concept, forms, 
+                                   subterms_raw)
+        else:
+            return self.encode_word(lemma, pos, sense, concept, forms)
+
+    def precompute(self, df_full):
+        #URI and parsed feats columns of the whole termtable, built with 
+        #vectorized string operations before the groups are encoded. Feats,
+        #subterms and components are parsed once per distinct value and
+        #shared by the entities built from them
+        base = self.base
+        lemma_local = df_full.lemma.str.replace(" ", "_", regex=False)
+        form_local = df_full.form.str.replace(" ", "_", regex=False)
+        concept_local = df_full.concept.str.replace(" ", "_", regex=False)
+        subjects = {d: self.subjects[d] for d in df_full.domain.unique()}
+        components = dict()
+        def component_uris(lemma):
+            #the URIs of the words are shared by all the expressions
+            return tuple(components.setdefault(w, URIRef(base + "component_" + w))
+                         for w in lemma.split(" "))
+        def subterm_uris(subterms):
+            if subterms == "":
+                return ()
+            return tuple(URIRef(base + "entry_" + s.strip().replace(" ", "_"))
+                         for s in subterms.split(";"))
+        def feats(feats_str):
+            return dataclasses.feats_tuple(parse_feats(feats_str))
+        is_mwe = df_full.lemma.str.contains(" ", regex=False)
+        return df_full.assign(
+            form_uri=base + "form_" + form_local,
+            lemma_uri=base + "form_" + lemma_local,
+            sense_uri=base + "sense_" + lemma_local,
+            entry_uri=base + "entry_" + lemma_local,
+            concept_uri=base + "concept_" + concept_local,
+            subject=df_full.domain.map(subjects),
+            form_feats=_map_unique(df_full.feats_x, feats),
+            lemma_feats=_map_unique(df_full.feats_y, feats),
+            is_mwe=is_mwe,
+            subterm_uris=_map_unique(df_full.subterms, subterm_uris),
+            component_uris=_map_unique(df_full.lemma.where(is_mwe, ""), 
+                                       component_uris))
+
+    def encode_group(self, key, data):
+        #Lexical entry of one (lemma, feats, concept, domain, IATE) group
+        if "form_uri" not in data:
+            data = self.precompute(data)
+        return self.encode_rows(key, _columns(data), range(len(data)))
+
+    def encode_rows(self, key, columns, idx):
+        #Lexical entry of the rows idx of the precomputed columns. Only 
+        #objects are built here, the URIs and feats are already there
+        lemma, lfeats, concept, domain, IATE = key
+        #the group-level columns are read from its last row
+        last = idx[-1]
+        subject = columns["subject"][last]
+        lex_sense = dataclasses.LexicalSense(columns["sense_uri"][last], subject)
+        lex_concept = dataclasses.LexicalConcept(columns["concept_uri"][last], 
+                                                 lex_sense, subject, IATE)
+        lemma_form = dataclasses.Form(columns["lemma_uri"][last], lemma, 
+                                      columns["lemma_feats"][last])
+        form, form_uri, form_feats = (columns["form"], columns["form_uri"], 
+                                      columns["form_feats"])
+        forms = [dataclasses.Form(form_uri[i], form[i], form_feats[i])
+                 for i in idx if form[i] != lemma]
+        instrument.count("entries")
+        instrument.count("forms", len(forms) + 1)
+        entry_uri, pos = columns["entry_uri"][last], columns["pos"][last]
+        if columns["is_mwe"][last]:
+            comps = [dataclasses.Component(uri) 
+                     for uri in columns["component_uris"][last]]
+            return dataclasses.MultiwordExpression(
+                entry_uri, lemma_form, pos, lex_sense, lex_concept, forms, 
+                columns["subterm_uris"][last], comps)
+        return dataclasses.Word(entry_uri, lemma_form, pos, lex_sense,
+                                lex_concept, forms)
+
+    def encode_entries(self, df_full):
+        df_full = self.precompute(df_full)
+        columns = _columns(df_full)
+        for key, idx in group_indices(df_full):
+            yield self.encode_rows(key, columns, idx)
+
+    def prefixes(self):
+        #prefixes of the Turtle output, the defaults plus the converter's ones
+        if self.namespaces is None:
+            return None
+        return {**writers.PREFIXES, **self.namespaces}
+
+    def lexicon(self):
+        return dataclasses.Lexicon(self.base + "lexicon", [], self.language)
+
+    def stream_ontolex(self, filename, df_full, format="turtle", memo=None,
+                       max_variants=None, variant_mode="cap"):
+        stream_ontolex(filename, self.lexicon(), self.encode_entries(df_full), 
+                       format, memo, max_variants, variant_mode, self.prefixes())
+
+    def graph_ontolex(self, df_full, memo=None, max_variants=None, 
+                      variant_mode="cap"):
+        #Graph of the lexicon and of the synonyms between its senses
+        lexicon = self.lexicon()
+        variants = VariantIndex(max_variants, variant_mode)
+        with instrument.stage("encode"):
+            for entry in self.encode_entries(df_full):
+                variants.add_entry(entry)
+                lexicon.entries.append(entry)
+        with instrument.stage("serialize"):
+            graph = lexicon.serialize(memo=memo)
+            for name, namespace in (self.namespaces or {}).items():
+                graph.bind(name, namespace, override=True)
+            graph.addN((s, p, o, graph) 
+                       for s, p, o in variants.triples())
+            instrument.count("triples", len(graph))
+        return graph
+
+    def incremental_ontolex(self, filename, df_full, format="turtle", 
+                            state_file=None, memo=None, max_variants=None,
+                            variant_mode="cap"):
+        #Same output as stream_ontolex, re-encoding only the groups added or
+        #changed since the previous run. The other entries are copied from the
+        #chunks rendered by the previous runs, kept in the state file. The 
+        #shared entities (components) of every group are rendered apart, and
+        #written after the first group using them, as in streaming mode
+        memo = dataclasses.EmittedCache() if memo is None else memo
+        memo.defer_shared = True
+        lexicon = self.lexicon()
+        state_file = filename + ".state" if state_file is None else state_file
+        namespaces = sorted((k, str(v)) for k, v in (self.namespaces or {}).items())
+        state = BuildState(state_file, {"version": STATE_VERSION, 
+                                        "format": format, "base": self.base,
+                                        "lexicon": lexicon.uri,
+                                        "subjects": sorted(self.subjects.items()),
+                                        "namespaces": namespaces})
+        renderer = writers.WRITERS[format](None, self.prefixes())
+        stored = state.fingerprints()
+        keys = list()
+        with instrument.stage("encode"):
+            changed, updates = list(), list()
+            for key, fingerprint, idx in group_fingerprints(df_full):
+                key_str = json.dumps([str(k) for k in key], ensure_ascii=False)
+                keys.append(key_str)
+                if stored.pop(key_str, None) == fingerprint:
+                    instrument.count("groups.unchanged")
+                else:
+                    changed.append((key, key_str, fingerprint, idx))
+            #the columns are precomputed only for the rows of the changed groups
+            if changed:
+                import numpy as np
+                rows = np.concatenate([idx for *_, idx in changed])
+                df_changed = self.precompute(df_full.iloc[rows])
+                columns = _columns(df_changed)
+            start = 0
+            for key, key_str, fingerprint, idx in changed:
+                instrument.count("groups.encoded")
+                entry = self.encode_rows(key, columns, 
+                                         range(start, start + len(idx)))
+                start += len(idx)
+                written = renderer.written
+                chunk = renderer.render(lexicon.entry_triples(entry, memo, 
+                                                              shared=False))
+                triples = renderer.written - written
+                shared = list()
+                for entity in memo.pop_pending():
+                    written = renderer.written
+                    shared.append([_shared_key(entity), 
+                                   renderer.render(entity.triples(memo)),
+                                   renderer.written - written])
+                #every group is rendered on its own, with all its shared ones
+                memo.clear(shared=True)
+                updates.append((key_str, fingerprint, entry.evokes.uri, 
+                                entry.evokes.lexicalizedSense.uri, chunk,
+                                triples, json.dumps(shared, ensure_ascii=False)))
+            #what is left was removed from the termtables
+            instrument.count("groups.removed", len(stored))
+            state.delete_many(stored)
+            state.put_many(updates)
+            state.commit()
+        variants = VariantIndex(max_variants, variant_mode)
+        n_triples = 0
+        written_shared = set()
+        with writers.open_writer(filename + ".tmp", format, 
+                                 self.prefixes()) as writer:
+            for key in keys:
+                concept, sense, chunk, triples, shared = state.get(key)
+                variants.add(URIRef(concept), URIRef(sense))
+                writer.write_rendered(chunk)
+                n_triples += triples
+                for shared_key, shared_chunk, shared_triples in json.loads(shared):
+                    if shared_key not in written_shared:
+                        written_shared.add(shared_key)
+                        writer.write_rendered(shared_chunk)
+                        n_triples += shared_triples
+            writer.write(lexicon.info_triples(len(keys)))
+            writer.write(variants.triples())
+        state.close()
+        os.replace(filename + ".tmp", filename)
+        instrument.count("triples", n_triples + writer.written)
+
+    def parallel_ontolex(self, filename, df_full, workers, memo=None, 
+                         max_variants=None, variant_mode="cap"):
+        #Encodes the chunks of the termtable in a process pool, each into a 
+        #sorted N-Triples file, and merges them into a sorted N-Triples output
+        #without duplicates. Same triples as the other modes
+        import tempfile
+        from concurrent.futures import ProcessPoolExecutor
+        memo = dataclasses.EmittedCache() if memo is None else memo
+        lexicon = self.lexicon()
+        variants = VariantIndex(max_variants, variant_mode)
+        n_entries = 0
+        tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(filename)))
+        paths = list()
+        try:
+            with instrument.stage("encode"):
+                #the converter itself is sent to the workers
+                with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                         initargs=(self, tmp_dir)) as executor:
+                    chunks = split_groups(df_full, workers * CHUNKS_PER_WORKER)
+                    for path, chunk_variants, skipped, captured in executor.map(
+                            _encode_chunk, chunks):
+                        paths.append(path)
+                        for concept, sense in chunk_variants:
+                            variants.add(concept, sense)
+                        n_entries += len(chunk_variants)
+                        memo.skipped += skipped
+                        instrument.merge(captured)
+            with instrument.stage("merge"):
+                tail = sorted({writers.nt_line(t) for t in 
+                               lexicon.info_triples(n_entries)} |
+                              {writers.nt_line(t) for t in 
+                               variants.triples()})
+                #only "\n" ends a line: codecs would also split the literals
+                #on the other Unicode line breaks, which nt_line keeps as they are
+                files = [open(path, "r", encoding="utf8", newline="\n") 
+                         for path in paths]
+                written, previous = 0, None
+                with codecs.open(filename, "w", "utf8") as fileout:
+                    for line in heapq.merge(*files, tail):
+                        if line != previous:
+                            fileout.write(line)
+                            written += 1
+                        previous = line
+                for f in files:
+                    f.close()
+                instrument.count("triples", written)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def term_index(self, lemma_table, form_table, index_file=None, df_full=None):
+        #Lookup index of the termbase, with URIs minted from the base
+        return TermIndex.open(lemma_table, form_table, self.base, index_file, 
+                              df_full=df_full)
+
+    def termtable2ontolex(self, filename, lemma_table, form_table, 
+                          format="turtle", stream=False, max_variants=None, 
+                          variant_mode="cap", index_file=None, 
+                          incremental=False, state_file=None, workers=1):
+        #with more than one worker the output is sorted N-Triples, the only 
+        #format the chunks encoded by the workers can be merged in
+        if workers > 1 and incremental:
+            raise ValueError("incremental conversion runs in a single process,"
+                             " workers must be 1")
+        if workers > 1 and format != "nt":
+            raise NotImplementedError("parallel conversion only writes 'nt'")
+        with instrument.stage("termtable2ontolex"):
+            df_full = load_termtable(lemma_table, form_table)
+            if index_file:
+                self.term_index(lemma_table, form_table, index_file, 
+                                df_full).close()
+            #the cache reports how many redundant emissions were skipped
+            memo = dataclasses.EmittedCache()
+            if incremental:
+                #the output is the same as in streaming mode
+                self.incremental_ontolex(filename, df_full, format, state_file,
+                                         memo, max_variants, variant_mode)
+            elif workers > 1:
+                self.parallel_ontolex(filename, df_full, workers, memo,
+                                      max_variants, variant_mode)
+            elif stream:
+                self.stream_ontolex(filename, df_full, format, memo, 
+                                    max_variants, variant_mode)
+            else:
+                graph = self.graph_ontolex(df_full, memo, max_variants, 
+                                           variant_mode)
+                with instrument.stage("write"):
+                    with codecs.open(filename, "w", "utf8") as fileout:
+                        fileout.write(graph.serialize(format=format))
+            instrument.count("memo.skipped", memo.skipped)
+        return memo
+
+
+#State of the worker processes, set once by _init_worker
+_worker = dict()
+
+def _init_worker(converter, tmp_dir):
+    _worker["converter"] = converter
+    _worker["tmp_dir"] = tmp_dir
+
+def _encode_chunk(task):
+    #Encodes a chunk of consecutive groups into a sorted N-Triples file.
+    #Returns its path, the (concept, sense) of its entries, in encoding 
+    #order, the skipped emissions and the counters of the chunk
+    i, df_chunk = task
+    converter = _worker["converter"]
+    lexicon = converter.lexicon()
+    memo = dataclasses.EmittedCache()
+    lines, variants = set(), list()
+    with instrument.capture() as captured:
+        for entry in converter.encode_entries(df_chunk):
+            lines.update(writers.nt_line(t) 
+                         for t in lexicon.entry_triples(entry, memo))
+            memo.clear()
+            variants.append((entry.evokes.uri, entry.evokes.lexicalizedSense.uri))
+    path = os.path.join(_worker["tmp_dir"], f"chunk_{i}.nt")
+    with codecs.open(path, "w", "utf8") as fileout:
+        fileout.writelines(sorted(lines))
+    return path, variants, memo.skipped, captured
+
+
+#The module functions use a default converter, whose base URI is set by set_uri
+DEFAULT = Converter()
+
+def __getattr__(name):
+    #BASE reads the base URI of the default converter
+    if name == "BASE":
+        return DEFAULT.base
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def set_uri(uri):
+    DEFAULT.base = uri
+
 def encode_form(form, feats=""):
-    uri_form = BASE + "form_" + re.sub(" ", "_", form)
-    if feats != "":
-        feats = parse_feats(feats)
-    else:
-        feats = {}
-    return dataclasses.Form(uri_form, form, feats)
+    return DEFAULT.encode_form(form, feats)
 
 def encode_sense(lemma, subject):
-    sense_uri = BASE + "sense_" + re.sub(" ", "_", lemma)
-    subject = subject_dict[subject]
-    return dataclasses.LexicalSense(sense_uri, subject)
+    return DEFAULT.encode_sense(lemma, subject)
 
 def encode_concept(concept, subject, sense, ontology_entry):
-    concept_uri = BASE + "concept_" + re.sub(" ", "_", concept)
-    subject = subject_dict[subject]
-    return dataclasses.LexicalConcept(concept_uri, sense, subject,
-                                      ontology_entry)
+    return DEFAULT.encode_concept(concept, subject, sense, ontology_entry)
 
 def encode_word(lemma, pos, sense, concept, forms):
-    entry_uri = BASE + "entry_" + re.sub(" ", "_", lemma.writtenRep)
-    return dataclasses.Word(entry_uri, lemma, pos, sense, concept, forms)
+    return DEFAULT.encode_word(lemma, pos, sense, concept, forms)
 
 def encode_mwe(lemma, pos, sense, concept, forms, subterms_raw):
-    entry_uri = BASE + "entry_" + re.sub(" ", "_", lemma.writtenRep)
-    words = lemma.writtenRep.split(" ")
-    comps, subterms = list(), list()
-    for w in words:
-        comp_uri = BASE + "component_" + w
-        comps.append(dataclasses.Component(comp_uri))
-    if subterms_raw != "":
-        for s in subterms_raw.split(";"):
-            s = s.strip()
-            s_uri = BASE + "entry_" + re.sub(" ", "_", s)
-            subterms.append(s_uri)
-    return dataclasses.MultiwordExpression(entry_uri, lemma, pos, sense, 
-                                           concept, forms, subterms, comps)
+    return DEFAULT.encode_mwe(lemma, pos, sense, concept, forms, subterms_raw)
 
 def encode_entry(lemma, pos, sense, concept, forms, subterms_raw):
-    if " " in lemma.writtenRep:
-        return encode_mwe(lemma, pos, sense, concept, forms, subterms_raw)
-    else:
-        return encode_word(lemma, pos, sense, concept, forms)
-
-def add_variants(graph):
-    for concept, _, _ in graph.triples((None, RDF.type, ONTOLEX.LexicalConcept)):
-        variants = [o for _, _, o in graph.triples((concept, ONTOLEX.lexicalizedSense, None))]
-        for v_1 in variants:
-            for v_2 in variants:
-                if v_1 == v_2:
-                    continue
-                graph.add((v_1, LEXINFO.synonym, v_2))
-    return graph
+    return DEFAULT.encode_entry(lemma, pos, sense, concept, forms, subterms_raw)
+
+def encode_group(key, data):
+    return DEFAULT.encode_group(key, data)
+
+def encode_entries(df_full):
+    return DEFAULT.encode_entries(df_full)
+
+def term_index(lemma_table, form_table, index_file=None, df_full=None):
+    return DEFAULT.term_index(lemma_table, form_table, index_file, df_full)
 
-def termtable2ontolex(filename, lemma_table, form_table):
-    df_forms = pd.read_excel(form_table)
-    df_entries = pd.read_excel(lemma_table)
-    df_full = df_forms.merge(df_entries, on=["lemma", "pos"])
-    df_full = df_full.fillna("")
-    groups = df_full.groupby(["lemma", "feats_y", "concept", "domain", "IATE"])
-
-    entries = list()
-    for (lemma, lfeats, concept, domain, IATE), data in groups:
-        lex_sense = encode_sense(lemma, domain)
-        lex_concept = encode_concept(concept, domain, lex_sense, IATE)
-        lemma_form = encode_form(lemma, lfeats)
-        forms = list()
-        for row in data.itertuples():
-            if row.form == lemma:
-                continue
-            forms.append(encode_form(row.form, row.feats_x))
-        entry = encode_entry(lemma_form, row.pos, lex_sense, lex_concept, forms, row.subterms)
-        entries.append(entry)
-    lexicon_uri = BASE + "lexicon"
-    lexicon = dataclasses.Lexicon(lexicon_uri, entries, "Italian")
-    graph = lexicon.serialize()
-    graph = add_variants(graph)
-    with codecs.open(filename, "w", "utf8") as fileout:
-        fileout.write(graph.serialize(format="turtle"))
+def termtable2ontolex(filename, lemma_table, form_table, format="turtle", 
+                      stream=False, max_variants=None, variant_mode="cap",
+                      index_file=None, incremental=False, state_file=None,
+                      workers=1):
+    return DEFAULT.termtable2ontolex(filename, lemma_table, form_table, format,
+                                     stream, max_variants, variant_mode, 
+                                     index_file, incremental, state_file, 
+                                     workers)
@@ -1,3 +1,4 @@
+import sys
 from dataclasses import dataclass, field, InitVar
 from typing import ClassVar
 from rdflib import Graph, Literal, RDF, RDFS, URIRef, XSD, Namespace
@@ -54,56 +55,155 @@ def initGraph():
     
     return g
 
-@dataclass
+class EmittedCache():
+    #Remembers the entities already emitted during one serialization run.
+    #The shared entities (e.g. the components of the words of many 
+    #expressions) are remembered by key for the whole run; the others can be
+    #forgotten after every entry. With defer_shared, the shared entities are
+    #not emitted inline but collected, to be rendered on their own
+    def __init__(self, defer_shared=False):
+        self.emitted = dict()
+        self.shared = dict()
+        self.defer_shared = defer_shared
+        self.pending = list()
+        self.skipped = 0
+
+    def __repr__(self):
+        return (f"EmittedCache(emitted={len(self.emitted)}, "
+                f"shared={len(self.shared)}, skipped={self.skipped})")
+
+    def first_time(self, entity):
+        key = entity.memo_key()
+        if key in self.emitted or key in self.shared:
+            self.skipped += 1
+            return False
+        if entity.SHARED:
+            self.shared[key] = None
+            if self.defer_shared:
+                self.pending.append(entity)
+                return False
+        else:
+            self.emitted[key] = entity
+        return True
+
+    def pop_pending(self):
+        #Shared entities deferred since the last call
+        pending, self.pending = self.pending, list()
+        return pending
+
+    def clear(self, shared=False):
+        #Forgets the entities emitted for an entry but keeps the count of 
+        #skipped ones, and the shared entities unless shared is true
+        self.emitted.clear()
+        if shared:
+            self.shared.clear()
+
+#Interned values shared by all the entities: the subjects of senses and 
+#concepts, the feats of the forms and the rdf:_n membership properties
+SUBJECTS = {"Other": Literal("Other")}
+FEATS = dict()
+MEMBERS = list()
+
+def subject_uri(subject_str):
+    try:
+        return SUBJECTS[subject_str]
+    except KeyError:
+        return SUBJECTS.setdefault(subject_str, getattr(DBC, subject_str))
+
+def feats_tuple(feats):
+    #(key, value) pairs of a feats dict, one shared tuple per distinct feats
+    if isinstance(feats, dict):
+        feats = tuple(feats.items())
+    return FEATS.setdefault(feats, feats)
+
+def member(i):
+    #rdf:_i
+    while len(MEMBERS) < i:
+        MEMBERS.append(getattr(RDF, f"_{len(MEMBERS) + 1}"))
+    return MEMBERS[i - 1]
+
+def as_uri(uri_str):
+    #URIRefs are kept as they are, so that entities can share them
+    return uri_str if type(uri_str) is URIRef else URIRef(uri_str)
+
+
+#The entities of the termbase are slotted. Slotted dataclasses are rebuilt by
+#the decorator, so their methods call super() with explicit arguments
+@dataclass(slots=True)
 class Entity():
     uri_str: InitVar[str]
     uri: URIRef = field(init=False)
+    #emitted once per run by EmittedCache, not once per entry
+    SHARED: ClassVar[bool] = False
 
     def __post_init__(self, uri_str):
-        self.uri = URIRef(uri_str)
-    
-    def serialize(self):
-        g = initGraph()
+        self.uri = as_uri(uri_str)
+
+    def memo_key(self):
+        return id(self)
+
+    def triples(self, memo=None):
+        #Yields the triples describing the entity (and its nested entities)
+        return
+        yield
+
+    def emit(self, memo=None):
+        #Same as triples(), unless the entity was already emitted in this run
+        if memo is None or memo.first_time(self):
+            yield from self.triples(memo)
+
+    def serialize(self, graph=None, memo=None):
+        #Adds the triples to a single graph, either the given one or a new one
+        g = initGraph() if graph is None else graph
+        memo = EmittedCache() if memo is None else memo
+        g.addN((s, p, o, g) for s, p, o in self.emit(memo))
         return g
 
 #Dataclasses for the termbase    
-@dataclass
+@dataclass(slots=True)
 class Form(Entity):
     writtenRep: str
-    morphSynProp: dict = field(default_factory=dict)
+    #feats as (key, value) pairs, a dict is also accepted
+    morphSynProp: tuple = ()
 
-    def serialize(self):
-        gender, number = self.morphSynProp.get("Gender", None), self.morphSynProp.get("Number", None)
-        this, g =self.uri,  super().serialize()
-        g.add((this, RDF.type, ONTOLEX.Form))
-        g.add((this, ONTOLEX.writtenRep, Literal(self.writtenRep, lang=LANG)))
+    def __post_init__(self, uri_str):
+        super(Form, self).__post_init__(uri_str)
+        self.morphSynProp = feats_tuple(self.morphSynProp)
+
+    def triples(self, memo=None):
+        gender = number = None
+        for key, value in self.morphSynProp:
+            if key == "Gender":
+                gender = value
+            elif key == "Number":
+                number = value
+        this = self.uri
+        yield from super(Form, self).triples(memo)
+        yield (this, RDF.type, ONTOLEX.Form)
+        yield (this, ONTOLEX.writtenRep, Literal(self.writtenRep, lang=LANG))
         if gender:
-            g.add((this, LEXINFO.gender, GENDER_DICT[gender]))
+            yield (this, LEXINFO.gender, GENDER_DICT[gender])
         if number:
-            g.add((this, LEXINFO.number, NUMBER_DICT[number]))
-        return g
+            yield (this, LEXINFO.number, NUMBER_DICT[number])
 
-@dataclass
+@dataclass(slots=True)
 class LexicalSense(Entity):
     subject_str: InitVar[str]
     # reference
     subject: URIRef = field(init=False)
 
     def __post_init__(self, uri_str, subject_str):
-        super().__post_init__(uri_str)
-        if subject_str == "Other":
-            self.subject = Literal("Other")
-        else:
-            self.subject = getattr(DBC, subject_str)
+        super(LexicalSense, self).__post_init__(uri_str)
+        self.subject = subject_uri(subject_str)
 
-    def serialize(self):
-        this, g = self.uri, super().serialize()
-        g.add((this, RDF.type, ONTOLEX.LexicalSense))
-        g.add((this, DCT.subject, self.subject))
-        return g
+    def triples(self, memo=None):
+        this = self.uri
+        yield from super(LexicalSense, self).triples(memo)
+        yield (this, RDF.type, ONTOLEX.LexicalSense)
+        yield (this, DCT.subject, self.subject)
 
 
-@dataclass
+@dataclass(slots=True)
 class LexicalConcept(Entity):
     lexicalizedSense: LexicalSense
     subject_str: InitVar[str] #dcterm:subject URI
@@ -112,28 +212,25 @@ class LexicalConcept(Entity):
     concept: URIRef = field(init=False, default=None)
 
     def __post_init__(self, uri_str, subject_str, concept_str=None):
-        super().__post_init__(uri_str)
-        if subject_str == "Other":
-            self.subject = Literal("Other")
-        else:
-            self.subject = getattr(DBC, subject_str)
+        super(LexicalConcept, self).__post_init__(uri_str)
+        self.subject = subject_uri(subject_str)
         if concept_str:
-            self.concept = URIRef(concept_str)
+            self.concept = as_uri(concept_str)
     
-    def serialize(self):
-        this, g = self.uri, super().serialize()
-        g.add((this, RDF.type, ONTOLEX.LexicalConcept))
-        g.add((this, DCT.subject, self.subject))
-        g.add((this, ONTOLEX.lexicalizedSense, self.lexicalizedSense.uri))
-        g.add((self.lexicalizedSense.uri, ONTOLEX.isLexicalizedSenseOf, this))
-        g.add((self.lexicalizedSense.uri, ONTOLEX.reference, this))
-        g += self.lexicalizedSense.serialize()
+    def triples(self, memo=None):
+        this = self.uri
+        yield from super(LexicalConcept, self).triples(memo)
+        yield (this, RDF.type, ONTOLEX.LexicalConcept)
+        yield (this, DCT.subject, self.subject)
+        yield (this, ONTOLEX.lexicalizedSense, self.lexicalizedSense.uri)
+        yield (self.lexicalizedSense.uri, ONTOLEX.isLexicalizedSenseOf, this)
+        yield (self.lexicalizedSense.uri, ONTOLEX.reference, this)
+        yield from self.lexicalizedSense.emit(memo)
         if self.concept:
-            g.add((this, ONTOLEX.concept, self.concept))
-        return g
+            yield (this, ONTOLEX.concept, self.concept)
 
 
-@dataclass
+@dataclass(slots=True)
 class LexicalEntry(Entity):
     canonicalForm: Form
     partOfSpeech: str
@@ -142,74 +239,106 @@ class LexicalEntry(Entity):
     evokes: LexicalConcept
     otherForms: list[Form] = field(default_factory=list)
 
-    def serialize(self):
-        this, g = self.uri, super().serialize()
-        g.add((this, ONTOLEX.canonicalForm, self.canonicalForm.uri))
-        g.add((this, RDFS.label, Literal(self.canonicalForm.writtenRep, LANG)))
-        g += self.canonicalForm.serialize()
-        g.add((this, ONTOLEX.evokes, self.evokes.uri))
-        g += self.evokes.serialize()
-        g.add((self.evokes.uri, ONTOLEX.isEvokedBy, this))
-        g.add((this, ONTOLEX.sense, self.sense.uri))
-        g.add((self.sense.uri, ONTOLEX.isSenseOf, this))
-        g += self.sense.serialize()
+    def __post_init__(self, uri_str):
+        super(LexicalEntry, self).__post_init__(uri_str)
+        #one string per part of speech
+        if isinstance(self.partOfSpeech, str):
+            self.partOfSpeech = sys.intern(self.partOfSpeech)
+
+    def triples(self, memo=None):
+        this = self.uri
+        yield from super(LexicalEntry, self).triples(memo)
+        yield (this, ONTOLEX.canonicalForm, self.canonicalForm.uri)
+        yield (this, RDFS.label, Literal(self.canonicalForm.writtenRep, LANG))
+        yield from self.canonicalForm.emit(memo)
+        yield (this, ONTOLEX.evokes, self.evokes.uri)
+        yield from self.evokes.emit(memo)
+        yield (self.evokes.uri, ONTOLEX.isEvokedBy, this)
+        yield (this, ONTOLEX.sense, self.sense.uri)
+        yield (self.sense.uri, ONTOLEX.isSenseOf, this)
+        yield from self.sense.emit(memo)
         for f in self.otherForms:
-            g.add((this, ONTOLEX.otherForm, f.uri))
-            g += f.serialize()
-        return g
+            yield (this, ONTOLEX.otherForm, f.uri)
+            yield from f.emit(memo)
 
-@dataclass
+@dataclass(slots=True)
 class Word(LexicalEntry):
     
-    def serialize(self):
-        this, g = self.uri, super().serialize()
-        g.add((this, RDF.type, ONTOLEX.Word))
-        return g
+    def triples(self, memo=None):
+        yield from super(Word, self).triples(memo)
+        yield (self.uri, RDF.type, ONTOLEX.Word)
 
-@dataclass
+@dataclass(slots=True)
 class Component(Entity):
     correspondsTo: LexicalEntry = None
-
-    def serialize(self):
-        this, g = self.uri, super().serialize()
-        g.add((this, RDF.type, DECOMP.Component))
+    SHARED: ClassVar[bool] = True
+
+    def memo_key(self):
+        #Components of different expressions share the URI of the word, the
+        #key is made of URIs to be the same from one run to the next
+        corresponds = self.correspondsTo.uri if self.correspondsTo else None
+        return (Component, self.uri, corresponds)
+
+    def triples(self, memo=None):
+        this = self.uri
+        yield from super(Component, self).triples(memo)
+        yield (this, RDF.type, DECOMP.Component)
         if self.correspondsTo:
-            g.add((this, DECOMP.correspondsTo, self.correspondsTo.uri))
-            g += self.correspondsTo.serialize()
-        return g
+            yield (this, DECOMP.correspondsTo, self.correspondsTo.uri)
+            yield from self.correspondsTo.emit(memo)
 
-@dataclass
+@dataclass(slots=True)
 class MultiwordExpression(LexicalEntry):
-    subterms: list[str] = field(default_factory=list)
+    #URIs of the subterms, a tuple of URIRefs can be shared between entries
+    subterms: tuple = ()
     constituents: list[Component] = field(default_factory=list)
 
-    def serialize(self):
-        this, g = self.uri, super().serialize()
-        g.add((this, RDF.type, ONTOLEX.MultiwordExpression))
+    def __post_init__(self, uri_str):
+        super(MultiwordExpression, self).__post_init__(uri_str)
+        if not all(type(s) is URIRef for s in self.subterms):
+            self.subterms = tuple(as_uri(s) for s in self.subterms)
+
+    def triples(self, memo=None):
+        this = self.uri
+        yield from super(MultiwordExpression, self).triples(memo)
+        yield (this, RDF.type, ONTOLEX.MultiwordExpression)
         for s in self.subterms:
-            s = URIRef(s)
-            g.add((this, DECOMP.subterm, s))
+            yield (this, DECOMP.subterm, s)
         for i, c in enumerate(self.constituents):
-            g.add((this, DECOMP.constituent, c.uri))
-            g.add((this, getattr(RDF, "_{}".format(i+1)), c.uri))
-            g += c.serialize()
-        return g
+            yield (this, DECOMP.constituent, c.uri)
+            yield (this, member(i + 1), c.uri)
+            yield from c.emit(memo)
 
 
-@dataclass
+@dataclass(slots=True)
 class Lexicon(Entity):
     entries: list[LexicalEntry]
     language: str
 
-    def serialize(self):
-        this, g = self.uri, super().serialize()
-        g.add((this, RDF.type, LIME.Lexicon))
+    def entry_triples(self, entry, memo=None, shared=True):
+        #Triples contributed by a single entry of the lexicon, followed by
+        #those of the shared entities deferred by the memo, unless shared is 
+        #false
+        yield (self.uri, LIME.entry, entry.uri)
+        yield from entry.emit(memo)
+        if shared and memo is not None:
+            for entity in memo.pop_pending():
+                yield from entity.triples(memo)
+
+    def info_triples(self, n_entries=None):
+        #Triples describing the lexicon itself
+        this = self.uri
+        if n_entries is None:
+            n_entries = len(self.entries)
+        yield (this, RDF.type, LIME.Lexicon)
+        yield (this, LIME.language, Literal(self.language))
+        yield (this, LIME.lexicalEntries, Literal(n_entries))
+
+    def triples(self, memo=None):
+        yield from super(Lexicon, self).triples(memo)
         for e in self.entries:
-            g.add((this, LIME.entry, e.uri))
-            g += e.serialize()
-        g.add((this, LIME.language, Literal(self.language)))
-        g.add((this, LIME.lexicalEntries, Literal(len(self.entries))))
-        return g
+            yield from self.entry_triples(e, memo)
+        yield from self.info_triples()
 
 #dataclasses for the corpus
 
@@ -228,14 +357,14 @@ class NIFContext(Entity):
         self.endIndex = Literal(end, datatype=XSD.nonNegativeInteger)
         self.isString = Literal(isString_str)
 
-    def serialize(self):
-        this, g = self.uri, super().serialize()
-        g.add((this, RDF.type, NIF.Context))
-        g.add((this, RDF.type, NIF.OffsetBasedString))
-        g.add((this, NIF.beginIndex, self.beginIndex))
-        g.add((this, NIF.endIndex, self.endIndex))
-        g.add((this, NIF.isString, self.isString))
-        return g
+    def triples(self, memo=None):
+        this = self.uri
+        yield from super().triples(memo)
+        yield (this, RDF.type, NIF.Context)
+        yield (this, RDF.type, NIF.OffsetBasedString)
+        yield (this, NIF.beginIndex, self.beginIndex)
+        yield (this, NIF.endIndex, self.endIndex)
+        yield (this, NIF.isString, self.isString)
     
 @dataclass
 class POWLANode(Entity):
@@ -254,21 +383,21 @@ class POWLANode(Entity):
                 child.next =self.hasChildren[i+1].uri
             child.hasParent = self.uri
 
-    def serialize(self):
-        this, g = self.uri, super().serialize()
-        g.add((this, RDF.type, POWLA.Node))
+    def triples(self, memo=None):
+        this = self.uri
+        yield from super().triples(memo)
+        yield (this, RDF.type, POWLA.Node)
         if self.next:
-            g.add((this, POWLA.next, self.next))
+            yield (this, POWLA.next, self.next)
         if self.previous:
-            g.add((this, POWLA.previous, self.previous))
+            yield (this, POWLA.previous, self.previous)
         if self.hasParent:
-            g.add((this, POWLA.hasParent, self.hasParent))
+            yield (this, POWLA.hasParent, self.hasParent)
         if self.string:
-            g.add((this, POWLA.string, self.string))
+            yield (this, POWLA.string, self.string)
         for child in self.hasChildren:
-            g.add((this, POWLA.hasChildren, child.uri))
-            g += child.serialize()
-        return g
+            yield (this, POWLA.hasChildren, child.uri)
+            yield from child.emit(memo)
 
 @dataclass
 class NIFPhrase(POWLANode):
@@ -291,17 +420,17 @@ class NIFPhrase(POWLANode):
         self.anchorOf = Literal(string)
         self.string = Literal(string)
 
-    def serialize(self):
-        this, g = self.uri, super().serialize()
-        g.add((this, RDF.type, NIF.OffsetBasedString))
-        g.add((this, RDF.type, NIF.Phrase))
-        g.add((this, RDF.type, POWLA.Node))
-        g.add((this, NIF.beginIndex, self.beginIndex))
-        g.add((this, NIF.endIndex, self.endIndex))
-        g.add((this, NIF.referenceContext, self.referenceContext.uri))
-        g.add((this, NIF.anchorOf, self.anchorOf))
-        g += self.referenceContext.serialize()
-        return g
+    def triples(self, memo=None):
+        this = self.uri
+        yield from super().triples(memo)
+        yield (this, RDF.type, NIF.OffsetBasedString)
+        yield (this, RDF.type, NIF.Phrase)
+        yield (this, RDF.type, POWLA.Node)
+        yield (this, NIF.beginIndex, self.beginIndex)
+        yield (this, NIF.endIndex, self.endIndex)
+        yield (this, NIF.referenceContext, self.referenceContext.uri)
+        yield (this, NIF.anchorOf, self.anchorOf)
+        yield from self.referenceContext.emit(memo)
     
 @dataclass    
 class POWLATerm(POWLANode):
@@ -319,12 +448,12 @@ class POWLATerm(POWLANode):
         string = " ".join([c.anchorOf.toPython() for c in self.hasChildren])
         self.string = Literal(string)
 
-    def serialize(self):
-        this, g = self.uri, super().serialize()
-        g.add((this, ITSRDF['term'], Literal("yes")))
-        g.add((this, ITSRDF.termAnnotatorsRef, self.termAnnotatorsRef))
-        g.add((this, ITSRDF.termInfoRef, self.termInfoRef))
-        return g
+    def triples(self, memo=None):
+        this = self.uri
+        yield from super().triples(memo)
+        yield (this, ITSRDF['term'], Literal("yes"))
+        yield (this, ITSRDF.termAnnotatorsRef, self.termAnnotatorsRef)
+        yield (this, ITSRDF.termInfoRef, self.termInfoRef)
 
 @dataclass 
 class POWLATermCollection(POWLANode):
@@ -335,14 +464,12 @@ class POWLATermCollection(POWLANode):
         super().__post_init__(uri_str)
 
 #Dataclasses for reading jsonl files produced by doccano
-from dataclasses import dataclass, field
-
-@dataclass
+@dataclass(slots=True)
 class Document:
     identifier: int
     string: str
 
-@dataclass
+@dataclass(slots=True)
 class Phrase:
     identifier: int
     begin: int
@@ -354,7 +481,7 @@ class Phrase:
     def __post_init__(self):
         self.string = self.context.string[self.begin: self.end]
 
-@dataclass
+@dataclass(slots=True)
 class Annotation:
     identifier: int
     string: str = field(init=False)
@@ -362,10 +489,10 @@ class Annotation:
     begin: str = field(init=False)
     end: str  = field(init=False)
     text: Document = field(repr=False)
+    #sorted by begin offset
     phrases: list[Phrase] = field(repr=False)
  
     def __post_init__(self):
-        self.phrases = sorted(self.phrases, key=lambda x: x.begin)
         self.string = ' '.join([p.string for p in self.phrases])
         self.label = self.phrases[0].label
         self.begin = self.phrases[0].begin
@@ -1,19 +1,21 @@
 import json
-import codecs
+from bisect import bisect_left, bisect_right
+from collections import deque
 from itertools import chain
 from pynif import NIFCollection
-import pandas as pd
-import re
-from . import terms2lod
+from . import terms2lod, writers, instrument
+from .lookup import TermIndex
+from .terms2lod import read_lines, read_jsonl
 
 
 from pynif import NIFPhrase, NIFContext
-from pynif.prefixes import ITSRDF, NIFPrefixes
+from pynif.prefixes import ITSRDF, NIF, NIFPrefixes
 
 from rdflib import Namespace, RDF, Literal, URIRef, Graph
 
 POWLA = Namespace("http://purl.org/powla/powla.owl#")
 TERMS = Namespace("http://example.com/terms#")
+WINDOW_PER_WORKER = 4
 
 class MyPhrase(NIFPhrase):
     def __init__(self, phrase):
@@ -63,26 +65,48 @@ class Term:
         yield (self.uri, ITSRDF.termInfoRef, URIRef(self.term_uri))
         yield (self.uri, ITSRDF.termAnnotatorsRef, URIRef(self.annotator))
 
-def get_next_uri(phrases, b):
-    ordered  = sorted([(p.beginIndex, p.uri) for p in phrases 
-                       if p.beginIndex>b])
-    if ordered:
-        return ordered[0][1]
-    else:
+class PhraseIndex():
+    #Phrases of a context sorted by beginIndex, with a (begin, end) lookup
+    def __init__(self, phrases):
+        self.ordered = sorted((p.beginIndex, p.uri, i) 
+                              for i, p in enumerate(phrases))
+        self.begins = [b for b, _, _ in self.ordered]
+        self.spans = dict()
+        for i, p in enumerate(phrases):
+            self.spans.setdefault((p.beginIndex, p.endIndex), i)
+
+    def next_uri(self, b):
+        #first phrase beginning after b
+        i = bisect_right(self.begins, b)
+        if i < len(self.ordered):
+            return self.ordered[i][1]
         return False
 
-def get_previous_uri(phrases, b):
-    ordered  = sorted([(p.beginIndex, p.uri) for p in phrases 
-                       if p.beginIndex<b], reverse=True)
-    if ordered:
-        return ordered[0][1]
-    else:
+    def previous_uri(self, b):
+        #last phrase beginning before b
+        i = bisect_left(self.begins, b)
+        if i > 0:
+            return self.ordered[i-1][1]
         return False
 
-def get_phrase_idx(phrases, b, e):
-    for i, p, in enumerate(phrases):
-        if p.beginIndex == b and p.endIndex == e:
-            return i
+    def phrase_idx(self, b, e):
+        return self.spans.get((b, e))
+
+    def links(self):
+        #(previous, next) URIs of every phrase, in one pass over the sorted phrases
+        links = dict()
+        n = len(self.ordered)
+        start, previous = 0, False
+        while start < n:
+            end = start
+            while end < n and self.begins[end] == self.begins[start]:
+                end += 1
+            next_uri = self.ordered[end][1] if end < n else False
+            for _, _, i in self.ordered[start:end]:
+                links[i] = (previous, next_uri)
+            previous = self.ordered[end-1][1]
+            start = end
+        return links
 
 def get_graph(collection):
         graph = Graph()
@@ -96,58 +120,154 @@ def get_graph(collection):
 
 
 
-def term2uri(form_table, lemma_table, base_uri):
-    df_forms = pd.read_excel(form_table)
-    df_entries = pd.read_excel(lemma_table)
-    df_full = df_forms.merge(df_entries, on=["lemma", "pos"])
-    df_full = df_full.fillna("")
-    uri_dict = dict()
-    for row in df_full.itertuples():
-        uri = base_uri + "sense_" + re.sub(" ", "_", row.lemma)
-        uri_dict[row.form, row.domain] = uri
-    return uri_dict
+def term2uri(form_table, lemma_table, base_uri, index_file=None):
+    #Compiled (form, domain) -> sense URI index, rebuilt only if the tables changed
+    return TermIndex.open(lemma_table, form_table, base_uri, index_file)
+
+def doc2context(i, doc, collection_uri, uri_dict, annotator):
+    #NIF context of the i-th document, with its phrases and POWLA terms
+    text = doc["text"]
+    context = NIFContext(uri=f"{collection_uri}/doc{i+1}", mention=text)
+    terms, _ = terms2lod.get_terms(doc)
+    spans = list(chain.from_iterable([terms2lod.get_word_span(t) 
+                                      for t in terms]))
+    for b, e in set(spans):
+        p_uri = f"{context.uri.split('#')[0]}#offset_{b}_{e}"
+        phrase = context.add_phrase(beginIndex=b,
+                                    endIndex=e,
+                                    uri=p_uri
+                                    )
+        context.phrases[-1] = MyPhrase(phrase)
+    all_terms = list()
+    index = PhraseIndex(context.phrases)
+    links = index.links()
+    for j, t in enumerate(terms):
+        term_uri = uri_dict.get(t[:2], None)
+        if not term_uri:
+            instrument.event("terms.not_in_termbase", t[:2])
+            continue
+        node = Term(f"term{i+1}_{j+1}", t[0], term_uri, annotator)
+        wspans = terms2lod.get_word_span(t)
+        for b, e in wspans:
+            idx = index.phrase_idx(b, e)
+            context.phrases[idx].parents.append(f"term{i+1}_{j+1}")
+            previous, next_node = links[idx]
+            if next_node:
+                context.phrases[idx].next = next_node
+            node.childs.append(context.phrases[idx].uri)
+            if previous:
+                context.phrases[idx].previous = previous
+        all_terms.append(node)
+    context.phrases += all_terms
+    instrument.count("documents")
+    instrument.count("terms", len(all_terms))
+    return context
+
+def context_triples(collection_uri, context):
+    yield (URIRef(collection_uri), NIF.hasContext, context.uri)
+    yield from context.triples()
+
+#State of the worker processes, set once by _init_worker
+_worker = dict()
+
+def _init_worker(collection_uri, uri_dict, annotator, format=None, index=None):
+    #a term index is opened again in every worker from its (filename, base_uri)
+    _worker["collection_uri"] = collection_uri
+    _worker["uri_dict"] = TermIndex(*index) if index else uri_dict
+    _worker["annotator"] = annotator
+    _worker["writer"] = writers.WRITERS[format](None) if format else None
+
+def _convert(task):
+    #Converts one document, already rendered when writing to a file. The
+    #counters of the conversion are sent back with the result
+    i, json_str = task
+    collection_uri = _worker["collection_uri"]
+    writer = _worker["writer"]
+    with instrument.capture() as captured:
+        context = doc2context(i, json.loads(json_str), collection_uri, 
+                              _worker["uri_dict"], _worker["annotator"])
+        triples = context_triples(collection_uri, context)
+        if writer is None:
+            result = list(triples)
+        else:
+            written = writer.written
+            result = writer.render(triples, context.uri)
+            instrument.count("triples", writer.written - written)
+    return result, captured
+
+def parallel_convert(lines, workers, collection_uri, uri_dict, annotator, 
+                     format=None):
+    #Converts the documents in a process pool, yielding the results in the 
+    #original order. Only a bounded window of documents is in flight
+    from concurrent.futures import ProcessPoolExecutor
+    window = deque()
+    #the sqlite connection of a term index is not sent to the workers
+    index = None
+    if isinstance(uri_dict, TermIndex):
+        uri_dict, index = None, (uri_dict.filename, uri_dict.base_uri)
+    with ProcessPoolExecutor(workers, initializer=_init_worker, 
+                             initargs=(collection_uri, uri_dict, annotator, 
+                                       format, index)) as executor:
+        for task in enumerate(lines):
+            window.append(executor.submit(_convert, task))
+            if len(window) >= workers * WINDOW_PER_WORKER:
+                yield _merged(window.popleft().result())
+        while window:
+            yield _merged(window.popleft().result())
+
+def _merged(done):
+    result, captured = done
+    instrument.merge(captured)
+    return result
+
+def stream_nif(file_out, docs, collection_uri, uri_dict, annotator, 
+               format="nt", workers=1):
+    #Writes the triples of each document as soon as it is converted.
+    #In N-Quads each document goes to the named graph of its context.
+    #With more than one worker, docs are the raw lines of the jsonl file
+    collection = NIFCollection(uri=collection_uri)
+    with writers.open_writer(file_out, format) as writer:
+        writer.write(collection.triples(), collection.uri)
+        if workers > 1:
+            for chunk in parallel_convert(docs, workers, collection_uri, 
+                                          uri_dict, annotator, format):
+                writer.write_rendered(chunk)
+        else:
+            for i, doc in enumerate(docs):
+                context = doc2context(i, doc, collection_uri, uri_dict, annotator)
+                writer.write(context_triples(collection_uri, context), 
+                             context.uri)
+    #rendered chunks were counted by the workers
+    instrument.count("triples", writer.written)
 
 def doccano2nif(file_out: str, jsonl_file: str, collection_uri: str, 
                 form_table: str, lemma_table: str, lexicon_uri: str,
-                annotator:str):
-    with codecs.open(jsonl_file, "r", "utf8") as filein:
-        json_list = list(filein)
-    data = [json.loads(json_str) for json_str in json_list]
+                annotator:str, index_file: str = None, stream: bool = False,
+                format: str = "nt", workers: int = 1):
+    with instrument.stage("doccano2nif"), \
+            term2uri(form_table, lemma_table, lexicon_uri, index_file) as uri_dict:
+        if workers > 1:
+            docs = read_lines(jsonl_file)
+        else:
+            docs = read_jsonl(jsonl_file)
+        if stream:
+            stream_nif(file_out, docs, collection_uri, uri_dict, annotator, 
+                       format, workers)
+            return
+        graph = graph_nif(docs, collection_uri, uri_dict, annotator, workers)
+        instrument.count("triples", len(graph))
+        return graph
 
+def graph_nif(docs, collection_uri, uri_dict, annotator, workers=1):
     collection = NIFCollection(uri=collection_uri)
-    for i, doc in enumerate(data):
-        text = doc["text"]
-        context = collection.add_context(
-            uri=f"{collection_uri}/doc{i+1}", mention=text)
-        terms, _ = terms2lod.get_terms(doc)
-        spans = list(chain.from_iterable([terms2lod.get_word_span(t) 
-                                          for t in terms]))
-        for b, e in set(spans):
-            p_uri = f"{context.uri.split('#')[0]}#offset_{b}_{e}"
-            phrase = context.add_phrase(beginIndex=b,
-                                        endIndex=e,
-                                        uri=p_uri
-                                        )
-            context.phrases[-1] = MyPhrase(phrase)
-        all_terms = list()
-        uri_dict = term2uri(form_table, lemma_table, lexicon_uri)
-        for j, t in enumerate(terms):
-            term_uri = uri_dict.get(t[:2], None)
-            if not term_uri:
-                print(f"term {t[:2]} is not in the termbase")
-                continue
-            node = Term(f"term{i+1}_{j+1}", t[0], term_uri, annotator)
-            wspans = terms2lod.get_word_span(t)
-            for b, e in wspans:
-                idx = get_phrase_idx(context.phrases, b, e)
-                context.phrases[idx].parents.append(f"term{i+1}_{j+1}")
-                next_node = get_next_uri(context.phrases, b)
-                if next_node:
-                    context.phrases[idx].next = next_node
-                node.childs.append(context.phrases[idx].uri)
-                previous = get_previous_uri(context.phrases, b)
-                if previous:
-                    context.phrases[idx].previous = previous
-            all_terms.append(node)
-        context.phrases += all_terms
-        return get_graph(collection)
\ No newline at end of file
+    graph = get_graph(collection)
+    if workers > 1:
+        for triples in parallel_convert(docs, workers, collection_uri, 
+                                        uri_dict, annotator):
+            graph.addN((s, p, o, graph) for s, p, o in triples)
+        return graph
+    for i, doc in enumerate(docs):
+        context = doc2context(i, doc, collection_uri, uri_dict, annotator)
+        graph.addN((s, p, o, graph) 
+                   for s, p, o in context_triples(collection_uri, context))
+    return graph
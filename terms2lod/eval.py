@@ -1,8 +1,12 @@
-from rdflib import Graph
-from tabulate import tabulate
+import os
+import json
+import codecs
+from .cache import hash_files, cache_path
+from . import instrument
 
 # load the termbase
 def _load_graph(filename):
+    from rdflib import Graph
     g = Graph()
     g.parse(filename)
     return g
@@ -32,59 +36,259 @@ def get_lemmas(graph):
   }"""
   return _query(graph, QUERY)
 
+# extract the gold standard in one pass over the triples
+ONTOLEX = "http://www.w3.org/ns/lemon/ontolex#"
+RDF_TYPE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#type"
+
+class _GoldSink():
+    def __init__(self):
+        self.forms = dict()
+        self.reprs = dict()
+        self.canonical = dict()
+
+    def triple(self, s, p, o):
+        p = str(p)
+        if p == RDF_TYPE and str(o) == ONTOLEX + "Form":
+            self.forms[s] = None
+        elif p == ONTOLEX + "writtenRep":
+            self.reprs.setdefault(s, dict())[o] = None
+        elif p == ONTOLEX + "canonicalForm":
+            self.canonical[s, o] = None
+
+    def terms(self, mode):
+        #same rows as the SPARQL queries of get_forms and get_lemmas
+        if mode == 'form':
+            forms = self.forms
+        elif mode == 'lemma':
+            forms = [form for _, form in self.canonical]
+        else:
+            raise NotImplementedError()
+        return [str(r) for form in forms for r in self.reprs.get(form, ())]
+
+def _parse_into(filename, sink):
+    #Parses any RDF format supported by rdflib into the sink, through a 
+    #store that passes on the triples instead of keeping them
+    from rdflib import Graph
+    from rdflib.store import Store
+
+    class SinkStore(Store):
+        def add(self, triple, context, quoted=False):
+            sink.triple(*triple)
+
+        def bind(self, prefix, namespace, override=True):
+            pass
+
+        def namespace(self, prefix):
+            return None
+
+        def prefix(self, namespace):
+            return None
+
+        def namespaces(self):
+            return iter(())
+
+    Graph(store=SinkStore()).parse(filename)
+
+def extract_gold(termbase_file, mode="form"):
+    #The triples are streamed without building a graph, in the order of the 
+    #file: N-Triples with the faster line parser, the other formats through
+    #the rdflib parsers
+    sink = _GoldSink()
+    if termbase_file.endswith(".nt"):
+        from rdflib.plugins.parsers.ntriples import W3CNTriplesParser
+        with open(termbase_file, "rb") as filein:
+            W3CNTriplesParser(sink=sink).parse(filein)
+    else:
+        _parse_into(termbase_file, sink)
+    return sink.terms(mode)
+
+def gold_standard(termbase_file, mode="form", cache_dir=None):
+    #Gold terms of a termbase, cached by the hash of the file and the mode
+    if mode not in ('form', 'lemma'):
+        raise NotImplementedError()
+    filename = cache_path(f"gold_{mode}_{hash_files(termbase_file)}.json", 
+                          cache_dir)
+    if os.path.exists(filename):
+        instrument.count("gold_cache.hits")
+        with codecs.open(filename, "r", "utf8") as filein:
+            return json.load(filein)
+    instrument.count("gold_cache.misses")
+    with instrument.stage("extract_gold"):
+        actual = extract_gold(termbase_file, mode)
+    with codecs.open(filename + ".tmp", "w", "utf8") as fileout:
+        json.dump(actual, fileout, ensure_ascii=False)
+    os.replace(filename + ".tmp", filename)
+    return actual
+
 # compute metrics
+METRICS = ['P@K', 'R@K', 'F1@K', 'AVP@K']
+
+def relevance(actual, predicted):
+    #Relevance of each ranked term: true if it is in the gold standard and 
+    #was not already ranked higher (the metrics count the distinct terms)
+    import numpy as np
+    actual = set(actual)
+    seen = set()
+    rel = np.zeros(len(predicted), dtype=bool)
+    for i, term in enumerate(predicted):
+        if term in actual and term not in seen:
+            rel[i] = True
+        seen.add(term)
+    return rel
+
+def metrics_from_relevance(rel, n_actual, ks):
+    #Rows of [P@K, R@K, F1@K, AVP@K] for each cutoff, from cumulative sums.
+    #rel can also be a 2D array with one ranked list per row, and n_actual
+    #an array with the size of the gold standard of each row
+    import numpy as np
+    rel = np.atleast_2d(rel)
+    n_actual = np.asarray(n_actual, dtype=float).reshape(-1, 1)
+    ks = np.asarray(ks, dtype=int)
+    n, m = rel.shape[1], max(int(ks.max()), 1)
+    hits = np.zeros((rel.shape[0], m))
+    cumulative = np.cumsum(rel[:, :m], axis=1)
+    hits[:, :min(n, m)] = cumulative
+    if n and m > n:
+        hits[:, n:] = cumulative[:, -1:]
+    ranks = np.arange(1, m + 1)
+    p_i = hits / ranks
+    #the metrics at K=0 (e.g. an empty ranked list) are 0
+    cut, empty = np.maximum(ks, 1) - 1, ks == 0
+    p = np.where(empty, 0.0, p_i[:, cut])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        r = np.where(empty, 0.0, hits[:, cut] / n_actual)
+        f1 = np.where(p + r > 0, (p * r) / (p + r), 0.0)
+    avp = np.where(empty, 0.0, np.cumsum(p_i, axis=1)[:, cut] / np.maximum(ks, 1))
+    metrics = np.stack([p, r, f1, avp], axis=-1)
+    return metrics[0] if metrics.shape[0] == 1 else metrics
+
+def metrics_at_K(actual, predicted, ks):
+    #[P@K, R@K, F1@K, AVP@K] for every cutoff in ks, in a single pass
+    ks = [k if k else len(predicted) for k in ks]
+    return metrics_from_relevance(relevance(actual, predicted), len(actual), ks)
+
 def P_at_K(actual, predicted, k=None):
-    if not k:
-        k = len(predicted)
-    rtp = set(predicted[:k]).intersection(set(actual))
-    return len(rtp)/k
+    return metrics_at_K(actual, predicted, [k])[0, 0]
 
 def R_at_K(actual, predicted, k=None):
-    if not k:
-        k = len(predicted)
-    rtp = set(predicted[:k]).intersection(set(actual))
-    return len(rtp)/len(actual)
+    return metrics_at_K(actual, predicted, [k])[0, 1]
 
 def F1_at_K(actual, predicted, k=None):
-    if not k:
-        k = len(predicted)
-    p = P_at_K(actual,predicted, k)
-    r = R_at_K(actual,predicted, k)
-    return (p*r)/(p+r)
+    return metrics_at_K(actual, predicted, [k])[0, 2]
 
 def AVP_at_K(actual, predicted, k=None):
-    if not k:
-        k = len(predicted)
-    sum = 0
-    for i in range(1, k+1):
-        sum += P_at_K(actual, predicted, k=i)
-    return sum/k
+    return metrics_at_K(actual, predicted, [k])[0, 3]
+
+# bootstrap confidence intervals
+BOOTSTRAP_CELLS = 1 << 24
+#replicates drawn from the same child seed, whatever the number of workers
+BOOTSTRAP_BLOCK = 100
+
+def bootstrap_metrics(rel, n_actual, ks, n_boot=1000, seed=None):
+    #Metrics of n_boot resamples (with replacement) of the candidate list, 
+    #keeping the rank order. Returns an array of shape (n_boot, len(ks), 4).
+    #A candidate drawn k times takes k ranks; a relevant one also counts k 
+    #times in the gold standard of the replicate, so that recall stays <= 1
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    rel = np.asarray(rel, dtype=bool)
+    n = len(rel)
+    if not n:
+        metrics = metrics_from_relevance(rel, n_actual, ks)
+        return np.broadcast_to(metrics, (n_boot, len(ks), 4)).copy()
+    batch = max(BOOTSTRAP_CELLS // n, 1)
+    results = list()
+    for start in range(0, n_boot, batch):
+        size = min(batch, n_boot - start)
+        idx = np.sort(rng.integers(0, n, (size, n)), axis=1)
+        sample = rel[idx]
+        sample_actual = n_actual - rel.sum() + sample.sum(axis=1)
+        metrics = metrics_from_relevance(sample, sample_actual, ks)
+        results.append(metrics.reshape(size, len(ks), 4))
+    return np.concatenate(results)
+
+def _bootstrap_task(args):
+    return bootstrap_metrics(*args)
+
+def bootstrap_ci(rel, n_actual, ks, n_boot=1000, alpha=0.05, seed=None, 
+                 workers=1):
+    #(low, high) percentile intervals, each of shape (len(ks), 4). The 
+    #replicates are drawn in blocks with their own seeds, so the same seed
+    #gives the same intervals with any number of workers
+    import numpy as np
+    sizes = [min(BOOTSTRAP_BLOCK, n_boot - start) 
+             for start in range(0, n_boot, BOOTSTRAP_BLOCK)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(rel, n_actual, ks, size, s) for size, s in zip(sizes, seeds)]
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(workers) as executor:
+            samples = list(executor.map(_bootstrap_task, tasks))
+    else:
+        samples = [_bootstrap_task(t) for t in tasks]
+    samples = np.concatenate(samples)
+    low, high = np.quantile(samples, [alpha / 2, 1 - alpha / 2], axis=0)
+    return low, high
 
 # evaluate the list of terms on a dataset
 def evaluate(predicted, termbase_file, mode: {'form', 'lemma'} = "form"):
-    termbase = _load_graph(termbase_file)
-    if mode == 'form':
-        actual = get_forms(termbase)
-    elif mode == 'lemma':
-        actual = get_lemmas(termbase)
-    else:
-        raise NotImplementedError()
-    atp = len(actual)
-    rtp = len(predicted)
-    table = [['K', 'P@K', 'R@K', 'F1@K', 'AVP@k']]
-    for k in [50, 100, 200, 500, atp, rtp]:
-        p_k = P_at_K(actual, predicted, k)
-        r_k = R_at_K(actual, predicted, k)
-        f1_k = F1_at_K(actual, predicted, k)
-        avp_k = AVP_at_K(actual, predicted, k)
-        str_k = f'{k}'
-        if k == atp:
-            str_k = str_k + ' (ATP)'
-        elif k == rtp:
-            str_k = str_k + ' (RTP)'
-        row = [str_k, f'{p_k:.2f}', f'{r_k:.2f}', f'{f1_k:.2f}', f'{avp_k:.2f}']
-        table.append(row)
-    
-    print(f"Evaluation on '{termbase_file}'", tabulate(table), sep='\n')
+    from tabulate import tabulate
+    with instrument.stage("evaluate"):
+        actual = gold_standard(termbase_file, mode)
+        atp = len(actual)
+        rtp = len(predicted)
+        instrument.count("terms.gold", atp)
+        instrument.count("terms.predicted", rtp)
+        table = [['K', 'P@K', 'R@K', 'F1@K', 'AVP@k']]
+        ks = [50, 100, 200, 500, atp, rtp]
+        metrics = metrics_at_K(actual, predicted, ks)
+        for k, (p_k, r_k, f1_k, avp_k) in zip(ks, metrics):
+            str_k = f'{k}'
+            if k == atp:
+                str_k = str_k + ' (ATP)'
+            elif k == rtp:
+                str_k = str_k + ' (RTP)'
+            row = [str_k, f'{p_k:.2f}', f'{r_k:.2f}', f'{f1_k:.2f}', f'{avp_k:.2f}']
+            table.append(row)
+
+        print(f"Evaluation on '{termbase_file}'", tabulate(table), sep='\n')
 
+# evaluate many lists of terms on the same dataset
+def evaluate_many(systems, termbase_file, mode: {'form', 'lemma'} = "form",
+                  ks=None, n_boot=0, alpha=0.05, seed=None, workers=1):
+    #Metric matrix of several ranked lists ({name: list of terms}), as a 
+    #DataFrame indexed by (system, K). By default the cutoffs are the ones 
+    #of evaluate. With n_boot > 0, bootstrap confidence intervals are added
+    with instrument.stage("evaluate_many"):
+        return _evaluate_many(systems, termbase_file, mode, ks, n_boot, alpha,
+                              seed, workers)
 
+def _evaluate_many(systems, termbase_file, mode, ks, n_boot, alpha, seed, 
+                   workers):
+    import numpy as np
+    import pandas as pd
+    actual = gold_standard(termbase_file, mode)
+    atp = len(actual)
+    instrument.count("terms.gold", atp)
+    frames = list()
+    for name, predicted in systems.items():
+        system_ks = ks if ks is not None else [50, 100, 200, 500, atp, 
+                                               len(predicted)]
+        #the cutoffs equal to the size of the list or of the gold standard
+        #are kept once
+        system_ks = list(dict.fromkeys(k if k else len(predicted) 
+                                       for k in system_ks))
+        rel = relevance(actual, predicted)
+        instrument.count("terms.predicted", len(predicted))
+        df = pd.DataFrame(metrics_from_relevance(rel, atp, system_ks), 
+                          columns=METRICS)
+        if n_boot:
+            low, high = bootstrap_ci(rel, atp, system_ks, n_boot, alpha, seed,
+                                     workers)
+            for j, metric in enumerate(METRICS):
+                df[f"{metric} low"] = low[:, j]
+                df[f"{metric} high"] = high[:, j]
+        df.insert(0, "K", np.asarray(system_ks))
+        df.insert(0, "system", name)
+        frames.append(df)
+    return pd.concat(frames).set_index(["system", "K"])
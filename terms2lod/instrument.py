@@ -0,0 +1,159 @@
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+#Opt-in instrumentation of the pipeline. Nothing is recorded outside of an
+#instrument() block, and the hooks are no-ops there:
+#
+#    with instrument(callback=print, profile=True) as recorder:
+#        termtable2ontolex(...)
+#    recorder.totals()
+_recorder = ContextVar("terms2lod_recorder", default=None)
+#events keep at most this many distinct details each
+MAX_DETAILS = 1000
+
+def peak_rss():
+    #High-water mark of the resident set of the process so far, in bytes
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+@dataclass
+class Stage():
+    name: str
+    parent: str = None
+    seconds: float = 0.0
+    #entities, triples, rows, cache hits and misses, counted events, ...
+    counters: Counter = field(default_factory=Counter)
+    #details of the counted events, e.g. the terms missing from the termbase
+    events: dict = field(default_factory=dict)
+    peak_rss: int = None
+    profile: object = field(default=None, repr=False)
+
+    def as_dict(self):
+        return {"name": self.name, "parent": self.parent,
+                "seconds": self.seconds, "counters": dict(self.counters),
+                "events": {k: dict(v) for k, v in self.events.items()},
+                "peak_rss": self.peak_rss}
+
+
+class Recorder():
+    #Stages recorded in an instrument() block, in the order they finished.
+    #The counters of a stage do not include the ones of its nested stages
+    def __init__(self, callback=None, profile=False):
+        self.callback = callback
+        self.profile = profile
+        self.stages = list()
+        self.stack = [Stage("")]
+
+    def __repr__(self):
+        return f"Recorder({len(self.stages)} stages)"
+
+    @property
+    def current(self):
+        return self.stack[-1]
+
+    def wants_profile(self, name):
+        if self.profile is True:
+            return True
+        return bool(self.profile) and name in self.profile
+
+    def totals(self):
+        #counters summed over all the stages
+        totals = Counter(self.stack[0].counters)
+        for stage in self.stages:
+            totals.update(stage.counters)
+        return totals
+
+    def as_dict(self):
+        return {"stages": [s.as_dict() for s in self.stages],
+                "totals": dict(self.totals())}
+
+
+@contextmanager
+def instrument(callback=None, profile=False):
+    #Records the stages run in the block. callback is called with every
+    #finished Stage; profile (True or a set of stage names) captures a
+    #cProfile of the stages, available as Stage.profile (pstats.Stats)
+    recorder = Recorder(callback, profile)
+    token = _recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorder.reset(token)
+
+@contextmanager
+def stage(name):
+    recorder = _recorder.get()
+    if recorder is None:
+        yield None
+        return
+    current = Stage(name, recorder.current.name or None)
+    profiler = None
+    if recorder.wants_profile(name) and not any(s.profile for s in recorder.stack):
+        import cProfile
+        profiler = cProfile.Profile()
+        current.profile = profiler
+    recorder.stack.append(current)
+    start = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield current
+    finally:
+        if profiler is not None:
+            import pstats
+            profiler.disable()
+            current.profile = pstats.Stats(profiler)
+        current.seconds = time.perf_counter() - start
+        current.peak_rss = peak_rss()
+        recorder.stack.pop()
+        recorder.stages.append(current)
+        if recorder.callback is not None:
+            recorder.callback(current)
+
+def count(name, n=1):
+    recorder = _recorder.get()
+    if recorder is not None:
+        recorder.current.counters[name] += n
+
+def event(name, detail=None):
+    #Counted event, e.g. a term missing from the termbase
+    recorder = _recorder.get()
+    if recorder is None:
+        return
+    current = recorder.current
+    current.counters[name] += 1
+    details = current.events.setdefault(name, Counter())
+    if detail in details or len(details) < MAX_DETAILS:
+        details[detail] += 1
+
+@contextmanager
+def capture():
+    #Records the counters and events of a block run in a worker process,
+    #to be sent back and merged in the recorder of the parent
+    recorder = Recorder()
+    token = _recorder.set(recorder)
+    try:
+        yield recorder.stack[0]
+    finally:
+        _recorder.reset(token)
+
+def merge(captured):
+    recorder = _recorder.get()
+    if recorder is None:
+        return
+    current = recorder.current
+    current.counters.update(captured.counters)
+    for name, details in captured.events.items():
+        merged = current.events.setdefault(name, Counter())
+        for detail, n in details.items():
+            if detail in merged or len(merged) < MAX_DETAILS:
+                merged[detail] += n
@@ -0,0 +1,121 @@
+import os
+import re
+import sqlite3
+from .cache import hash_files, cache_path
+from .termtables import load_termtable
+from . import instrument
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE terms (form TEXT, domain TEXT, lemma TEXT, local TEXT,
+                    PRIMARY KEY (form, domain)) WITHOUT ROWID;
+"""
+
+def _local_name(lemma):
+    return re.sub(" ", "_", lemma)
+
+class TermIndex():
+    #Compiled (form, domain) -> sense URI lookup of a termbase, stored in sqlite.
+    #URIs are stored relative to the lexicon, so the same index serves any base
+    def __init__(self, filename, base_uri):
+        self.filename = filename
+        self.base_uri = base_uri
+        self.connection = sqlite3.connect(f"file:{filename}?mode=ro", uri=True,
+                                          check_same_thread=False)
+
+    @staticmethod
+    def build(filename, df_full, source_hash=""):
+        tmp = filename + ".tmp"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        with sqlite3.connect(tmp) as connection:
+            connection.executescript(SCHEMA)
+            connection.execute("INSERT INTO meta VALUES ('hash', ?)", (source_hash,))
+            rows = ((row.form, row.domain, row.lemma, _local_name(row.lemma))
+                    for row in df_full.itertuples())
+            connection.executemany("INSERT OR REPLACE INTO terms VALUES (?, ?, ?, ?)",
+                                   rows)
+        connection.close()
+        os.replace(tmp, filename)
+
+    @staticmethod
+    def stored_hash(filename):
+        try:
+            with sqlite3.connect(f"file:{filename}?mode=ro", uri=True) as connection:
+                value = connection.execute(
+                    "SELECT value FROM meta WHERE key = 'hash'").fetchone()
+            connection.close()
+        except sqlite3.Error:
+            return None
+        return value[0] if value else None
+
+    @classmethod
+    def open(cls, lemma_table, form_table, base_uri, filename=None,
+             cache_dir=None, df_full=None):
+        #Loads the index of the termtables, (re)building it if they changed
+        source_hash = hash_files(lemma_table, form_table)
+        if filename is None:
+            filename = cache_path(f"termindex_{source_hash}.sqlite", cache_dir)
+        if cls.stored_hash(filename) != source_hash:
+            instrument.count("termindex_cache.misses")
+            if df_full is None:
+                df_full = load_termtable(lemma_table, form_table, cache_dir)
+            cls.build(filename, df_full, source_hash)
+        else:
+            instrument.count("termindex_cache.hits")
+        return cls(filename, base_uri)
+
+    def __getstate__(self):
+        return {"filename": self.filename, "base_uri": self.base_uri}
+
+    def __setstate__(self, state):
+        self.__init__(state["filename"], state["base_uri"])
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM terms").fetchone()[0]
+
+    def __contains__(self, key):
+        return self.lookup(*key) is not None
+
+    def __getitem__(self, key):
+        uri = self.get(key)
+        if uri is None:
+            raise KeyError(key)
+        return uri
+
+    def lookup(self, form, domain):
+        #(lemma, sense URI, entry URI) of a form annotated with a domain
+        row = self.connection.execute(
+            "SELECT lemma, local FROM terms WHERE form = ? AND domain = ?",
+            (form, domain)).fetchone()
+        if row is None:
+            return None
+        lemma, local = row
+        return lemma, self.base_uri + "sense_" + local, \
+            self.base_uri + "entry_" + local
+
+    def get(self, key, default=None):
+        found = self.lookup(*key)
+        return found[1] if found else default
+
+    def lemma(self, form, domain):
+        found = self.lookup(form, domain)
+        return found[0] if found else None
+
+    def entry(self, form, domain):
+        found = self.lookup(form, domain)
+        return found[2] if found else None
+
+    def as_dict(self):
+        rows = self.connection.execute("SELECT form, domain, local FROM terms")
+        return {(form, domain): self.base_uri + "sense_" + local
+                for form, domain, local in rows}
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
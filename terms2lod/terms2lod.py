@@ -3,10 +3,38 @@ import codecs
 from collections import Counter
 from itertools import chain
 from collections import defaultdict
-import stanza
-import pandas as pd
 import re
+import logging
 from .dataclasses import Document, Phrase, Annotation
+from .cache import ParseCache
+from . import instrument
+
+#Number of terms sent to stanza at once
+BATCH_SIZE = 256
+logger = logging.getLogger(__name__)
+TOKEN_RE = re.compile(r'\w+|\W')
+WORD_RE = re.compile(r'\w')
+END = ""
+
+def _find(parent, x):
+    #root of x in the union-find forest, halving the path on the way
+    while parent[x] != x:
+        parent[x] = parent[parent[x]]
+        x = parent[x]
+    return x
+
+def read_lines(jsonl_file):
+    #Non-empty lines of a doccano export. Only "\n" ends a line, the other
+    #Unicode line breaks can occur in the texts
+    with open(jsonl_file, "r", encoding="utf8", newline="\n") as filein:
+        for json_str in filein:
+            if json_str.strip():
+                yield json_str
+
+def read_jsonl(jsonl_file):
+    #Yields the documents of a doccano export one line at a time
+    for json_str in read_lines(jsonl_file):
+        yield json.loads(json_str)
 
 def json2annotations(json_line):
     document = Document(json_line['id'], json_line['text'])
@@ -15,57 +43,187 @@ def json2annotations(json_line):
     for entity in json_line['entities']:
         phrase = Phrase(entity['id'], entity['start_offset'], 
                         entity['end_offset'], entity['label'], document)
-        all_phrases[entity['id']] = [phrase]
-    #Extracts links between entities
-    sorted_relations = sorted([(min(rel['from_id'], rel['to_id']), 
-                                max(rel['from_id'], rel['to_id']))
-                                for rel in json_line['relations']])
-    for begin, end in sorted_relations:
-        try:
-            part_1 = all_phrases.pop(begin)
-        except KeyError:
+        all_phrases[entity['id']] = phrase
+    #Links between entities are merged with a union-find over their ids, 
+    #so that chains of any length end up in the same annotation
+    parent = {i: i for i in all_phrases}
+    for rel in json_line['relations']:
+        if rel['from_id'] not in parent or rel['to_id'] not in parent:
             continue
-        all_phrases[end] += part_1
+        root_1 = _find(parent, rel['from_id'])
+        root_2 = _find(parent, rel['to_id'])
+        if root_1 != root_2:
+            parent[min(root_1, root_2)] = max(root_1, root_2)
+    groups = dict()
+    for i, phrase in all_phrases.items():
+        groups.setdefault(_find(parent, i), list()).append(phrase)
+    #an annotation takes the place of its last entity, as the entities 
+    #linked to it are merged into it
+    position = {i: n for n, i in enumerate(all_phrases)}
+    groups = sorted(groups.items(), key=lambda x: position[x[0]])
     all_annotations = list()
-    for i, phrases in enumerate(all_phrases.values()):
+    for i, (_, phrases) in enumerate(groups):
+        phrases.sort(key=lambda x: x.begin)
         annotation = Annotation(i, document, phrases)
         all_annotations.append(annotation)
     return all_annotations
 
+def normalize_term(string):
+    return re.sub(r' +', r' ', string.lower().strip())
+
+def get_terms(json_line):
+    #(form, domain, phrases) of every term annotated in a doccano document
+    annotations = json2annotations(json_line)
+    terms = [(normalize_term(a.string), a.label, tuple(a.phrases)) 
+             for a in annotations]
+    return terms, annotations
+
+def get_word_span(term):
+    #(begin, end) offsets of the words of a term in its document
+    spans = list()
+    for phrase in term[2]:
+        for m in re.finditer(r'\S+', phrase.string):
+            spans.append((phrase.begin + m.start(), phrase.begin + m.end()))
+    return spans
+
+
+def get_head(words):
+    #(position, lemma, upos, feats) of the syntactic head of a parsed term
+    for i, w in enumerate(words):
+        if w.head == 0:
+            return i, w.lemma, w.upos, w.feats
+    w = words[0]
+    return 0, w.lemma, w.upos, w.feats
+
+def model_version():
+    import stanza
+    from stanza.resources.common import DEFAULT_RESOURCES_VERSION
+    return f"{stanza.__version__}/{DEFAULT_RESOURCES_VERSION}"
 
-def jsonl2termtable(jsonl_file: str, fileout: str, lang: str):
-    def get_subterms(target_term, all_terms):
-        for term in all_terms:
-            if re.search(r'\b' + term + r'\b', target_term) \
-                and term != target_term:
+def parse_terms(nlp, terms, batch_size=BATCH_SIZE):
+    #Parses the terms in batches of stanza documents, one document (and 
+    #one sentence) per term, and yields their heads in the same order
+    import stanza
+    for start in range(0, len(terms), batch_size):
+        batch = [stanza.Document([], text=t) 
+                 for t in terms[start:start + batch_size]]
+        for doc in nlp(batch):
+            yield get_head(doc.sentences[0].words)
+
+class TermTrie():
+    #Token-level trie of the terms. Tokens are runs of word characters and 
+    #single non-word characters, so that a term is found in another one iff 
+    #re.search(r'\b' + re.escape(term) + r'\b', target) matches
+    def __init__(self, terms):
+        self.root = dict()
+        for term in terms:
+            tokens = TOKEN_RE.findall(term)
+            if not tokens:
+                continue
+            node = self.root
+            for token in tokens:
+                node = node.setdefault(token, dict())
+            node[END] = (term, _is_word(tokens[0]), _is_word(tokens[-1]))
+
+    def find(self, target):
+        #terms occurring in target, in one pass over its tokens
+        tokens = TOKEN_RE.findall(target)
+        n = len(tokens)
+        found = dict()
+        for start in range(n):
+            node = self.root
+            for end in range(start, n):
+                node = node.get(tokens[end])
+                if node is None:
+                    break
+                if END not in node:
+                    continue
+                term, word_begin, word_end = node[END]
+                #a term beginning (ending) with a non-word character needs 
+                #a word character before (after) it
+                if not word_begin and (start == 0 or not _is_word(tokens[start-1])):
+                    continue
+                if not word_end and (end + 1 == n or not _is_word(tokens[end+1])):
+                    continue
+                found[term] = None
+        return list(found)
+
+def _is_word(token):
+    return WORD_RE.match(token) is not None
+
+def _parse_heads(all_terms, lang, batch_size, parse_cache=None):
+    #{term: head} of the distinct terms, only the ones missing from the parse
+    #cache go to stanza. Also returns the hits and misses of the cache
+    only_terms = sorted(set(list(zip(*all_terms))[0]))
+    version = model_version()
+    heads = parse_cache.get_many(only_terms, lang, version) if parse_cache else {}
+    missing = [t for t in only_terms if t not in heads]
+    instrument.count("terms", len(only_terms))
+    instrument.count("parse_cache.hits", len(heads))
+    instrument.count("parse_cache.misses", len(missing))
+    if missing:
+        import stanza
+        with instrument.stage("parse"):
+            nlp = stanza.Pipeline(lang=lang, 
+                                  processors='tokenize,pos,lemma,depparse',
+                                  tokenize_no_ssplit=True)
+            parsed = dict(zip(missing, parse_terms(nlp, missing, batch_size)))
+        if parse_cache:
+            parse_cache.put_many(parsed, lang, version)
+        heads.update(parsed)
+    return heads, {"hits": len(only_terms) - len(missing), "misses": len(missing)}
+
+def jsonl2termtable(jsonl_file: str, fileout: str, lang: str, 
+                    batch_size: int = BATCH_SIZE, parse_cache=False):
+    #parse_cache is opt-in: True keeps the parses in the default cache 
+    #directory (see cache.default_cache_dir), a ParseCache uses that one.
+    #With a cache, returns its {"hits", "misses"} of the run (also logged)
+    with instrument.stage("jsonl2termtable"):
+        return _jsonl2termtable(jsonl_file, fileout, lang, batch_size, 
+                                parse_cache)
+
+def _jsonl2termtable(jsonl_file, fileout, lang, batch_size, parse_cache):
+    def get_subterms(target_term, trie):
+        for term in sorted(trie.find(target_term)):
+            if term != target_term:
                 yield term
     with codecs.open(jsonl_file, "r", "utf8") as filein:
         json_list = list(filein)
         data = [json.loads(json_str) for json_str in json_list]
+    instrument.count("documents", len(data))
     #get terms from jsonl file
     all_terms = set()
     for line in data:
         annotation_list = json2annotations(line)
         for annotation in annotation_list:
-            term = re.sub(r' +', r' ', annotation.string.lower().strip())
+            term = normalize_term(annotation.string)
             all_terms.add((term, annotation.label))
     #process terms
-    nlp = stanza.Pipeline(lang=lang, processors='tokenize,pos,lemma,depparse')
+    owned = parse_cache is True
+    if owned:
+        parse_cache = ParseCache()
+    try:
+        heads, stats = _parse_heads(all_terms, lang, batch_size, parse_cache)
+    finally:
+        if owned:
+            parse_cache.close()
     table = list()
-    only_terms = set(list(zip(*all_terms))[0])
-    for term, domain in all_terms:
-        words = nlp(term).sentences[0].words
-        for i, w in enumerate(words):
-            if w.head == 0:
-                head = w
-                break
+    only_terms = sorted(heads)
+    trie = TermTrie(only_terms)
+    for term, domain in sorted(all_terms):
+        i, head_lemma, upos, feats = heads[term]
         term_words = term.split(' ')
-    try:
-        term_words[i] = head.lemma
-    except IndexError:
-        pass
-    lemma = ' '.join(term_words)
-    subterms = '; '.join([t for t in get_subterms(term, only_terms)])
-    table.append((term, lemma, head.upos, domain, head.feats,subterms))
+        try:
+            term_words[i] = head_lemma
+        except IndexError:
+            pass
+        lemma = ' '.join(term_words)
+        subterms = '; '.join([t for t in get_subterms(term, trie)])
+        table.append((term, lemma, upos, domain, feats,subterms))
+    import pandas as pd
     df = pd.DataFrame(table, columns=["form", "lemma", "pos", "domain", "feats", "subterms"])
     df.to_excel(fileout, index=False)
+    if parse_cache:
+        logger.info("parse cache: %d hits, %d misses", stats["hits"], 
+                    stats["misses"])
+        return stats
\ No newline at end of file
@@ -0,0 +1,86 @@
+import os
+from .cache import hash_files, cache_path
+from . import instrument
+
+EXCEL = {".xlsx", ".xls"}
+#bumped when the merged tables change, so that older cached ones are not read
+CACHE_VERSION = 2
+
+def read_table(filename):
+    #Reads a termtable from Excel, CSV, Parquet or Arrow (Feather) files.
+    #Every cell is read as text, so a table gives the same values (e.g. IATE
+    #ids) whatever its format
+    import pandas as pd
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in EXCEL:
+        return pd.read_excel(filename, dtype=str)
+    elif ext == ".csv":
+        return pd.read_csv(filename, dtype=str)
+    elif ext == ".parquet":
+        return _as_text(pd.read_parquet(filename))
+    elif ext in {".arrow", ".feather"}:
+        return _as_text(pd.read_feather(filename))
+    else:
+        raise NotImplementedError(f"unsupported termtable format '{ext}'")
+
+def _as_text(df):
+    #Typed columns of columnar files as text, keeping the missing values. 
+    #Whole floats (ints of a column with blanks) are written as in Excel
+    import pandas as pd
+    def text(v):
+        if isinstance(v, str) or pd.isna(v):
+            return v
+        if isinstance(v, float) and v.is_integer():
+            return str(int(v))
+        return str(v)
+    for column in df.columns:
+        df[column] = df[column].map(text)
+    return df
+
+def merge_tables(df_forms, df_entries):
+    instrument.count("rows.forms", len(df_forms))
+    instrument.count("rows.entries", len(df_entries))
+    df_full = df_forms.merge(df_entries, on=["lemma", "pos"])
+    return df_full.fillna("")
+
+def _read_cached(filename):
+    import pandas as pd
+    if filename.endswith(".parquet"):
+        return pd.read_parquet(filename)
+    return pd.read_pickle(filename)
+
+def _write_cached(df_full, name, cache_dir):
+    #Parquet needs pyarrow (or fastparquet) and columns it can type, 
+    #otherwise falls back to pickle
+    filename = cache_path(name + ".parquet", cache_dir)
+    try:
+        df_full.to_parquet(filename + ".tmp", index=False)
+    except (ImportError, TypeError, ValueError):
+        if os.path.exists(filename + ".tmp"):
+            os.remove(filename + ".tmp")
+        filename = cache_path(name + ".pkl", cache_dir)
+        df_full.to_pickle(filename + ".tmp")
+    os.replace(filename + ".tmp", filename)
+
+def load_termtable(lemma_table, form_table, cache_dir=None, use_cache=True):
+    with instrument.stage("load_termtable"):
+        return _load_termtable(lemma_table, form_table, cache_dir, use_cache)
+
+def _load_termtable(lemma_table, form_table, cache_dir, use_cache):
+    #Merged forms and entries tables. When one of them is an Excel file, 
+    #the merged table is cached in columnar form, keyed by the content hash
+    excel = {os.path.splitext(f)[1].lower() for f in (lemma_table, form_table)}
+    if not use_cache or not excel & EXCEL:
+        return merge_tables(read_table(form_table), read_table(lemma_table))
+    name = f"termtable_v{CACHE_VERSION}_" + hash_files(lemma_table, form_table)
+    for ext in (".parquet", ".pkl"):
+        filename = cache_path(name + ext, cache_dir)
+        if os.path.exists(filename):
+            instrument.count("termtable_cache.hits")
+            df_full = _read_cached(filename)
+            instrument.count("rows.cached", len(df_full))
+            return df_full
+    instrument.count("termtable_cache.misses")
+    df_full = merge_tables(read_table(form_table), read_table(lemma_table))
+    _write_cached(df_full, name, cache_dir)
+    return df_full
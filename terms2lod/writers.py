@@ -0,0 +1,150 @@
+import re
+import codecs
+from contextlib import contextmanager
+from rdflib import Literal, RDF, RDFS, XSD
+from .dataclasses import ONTOLEX, LEXINFO, DECOMP, DCT, DBC, LIME, ITSRDF, \
+    NIF, POWLA
+
+#Prefixes used by the Turtle writer (same bindings as dataclasses.initGraph)
+PREFIXES = {
+    "rdf": RDF,
+    "rdfs": RDFS,
+    "xsd": XSD,
+    "ontolex": ONTOLEX,
+    "lexinfo": LEXINFO,
+    "dct": DCT,
+    "decomp": DECOMP,
+    "dbc": DBC,
+    "lime": LIME,
+    "itsrdf": ITSRDF,
+    "nif": NIF,
+    "powla": POWLA
+}
+
+LOCAL_NAME = re.compile(r"^[A-Za-z0-9_]([A-Za-z0-9_.-]*[A-Za-z0-9_-])?$")
+ESCAPES = {"\\": "\\\\", '"': '\\"', "\n": "\\n", "\r": "\\r"}
+ESCAPE_RE = re.compile(r'[\\"\n\r]')
+QNAME_CACHE_SIZE = 10000
+
+def _escape(string):
+    return ESCAPE_RE.sub(lambda m: ESCAPES[m.group(0)], string)
+
+def nt_term(term):
+    if isinstance(term, Literal):
+        lexical = f'"{_escape(str(term))}"'
+        if term.language:
+            return f"{lexical}@{term.language}"
+        if term.datatype:
+            return f"{lexical}^^<{term.datatype}>"
+        return lexical
+    return f"<{term}>"
+
+def nt_line(triple):
+    s, p, o = triple
+    return f"{nt_term(s)} {nt_term(p)} {nt_term(o)} .\n"
+
+
+class NTriplesWriter:
+    #N-Triples have no prefixes, they are accepted for a uniform interface
+    def __init__(self, fileout, prefixes=None):
+        self.fileout = fileout
+        self.written = 0
+
+    def start(self):
+        pass
+
+    def render(self, triples, graph=None):
+        #Renders a chunk of triples, dropping duplicates within the chunk
+        lines = dict.fromkeys(nt_line(t) for t in triples)
+        self.written += len(lines)
+        return "".join(lines)
+
+    def write(self, triples, graph=None):
+        self.fileout.write(self.render(triples, graph))
+
+    def write_rendered(self, chunk):
+        #Writes a chunk already rendered, e.g. by a worker process
+        self.fileout.write(chunk)
+
+    def close(self):
+        pass
+
+
+class NQuadsWriter(NTriplesWriter):
+    def render(self, triples, graph=None):
+        #Same as N-Triples, with every triple of the chunk in the named graph
+        if graph is None:
+            return super().render(triples)
+        graph = nt_term(graph)
+        lines = dict.fromkeys(nt_line(t)[:-2] + graph + " .\n" for t in triples)
+        self.written += len(lines)
+        return "".join(lines)
+
+
+class TurtleWriter(NTriplesWriter):
+    def __init__(self, fileout, prefixes=None):
+        super().__init__(fileout)
+        prefixes = PREFIXES if prefixes is None else prefixes
+        self.prefixes = sorted(((str(ns), name) for name, ns in prefixes.items()),
+                               key=lambda x: len(x[0]), reverse=True)
+        self._qnames = dict()
+
+    def start(self):
+        for ns, name in sorted(self.prefixes, key=lambda x: x[1]):
+            self.fileout.write(f"@prefix {name}: <{ns}> .\n")
+        self.fileout.write("\n")
+
+    def qname(self, uri):
+        try:
+            return self._qnames[uri]
+        except KeyError:
+            pass
+        qname = f"<{uri}>"
+        for ns, name in self.prefixes:
+            if uri.startswith(ns) and LOCAL_NAME.match(uri[len(ns):]):
+                qname = f"{name}:{uri[len(ns):]}"
+                break
+        if len(self._qnames) < QNAME_CACHE_SIZE:
+            self._qnames[uri] = qname
+        return qname
+
+    def term(self, term):
+        if isinstance(term, Literal):
+            lexical = f'"{_escape(str(term))}"'
+            if term.language:
+                return f"{lexical}@{term.language}"
+            if term.datatype:
+                return f"{lexical}^^{self.qname(str(term.datatype))}"
+            return lexical
+        return self.qname(str(term))
+
+    def render(self, triples, graph=None):
+        #Groups a chunk of triples by subject and predicate, in order of appearance
+        subjects = dict()
+        for s, p, o in triples:
+            subjects.setdefault(s, dict()).setdefault(p, dict())[o] = None
+        blocks = list()
+        for s, predicates in subjects.items():
+            lines = list()
+            for p, objects in predicates.items():
+                verb = "a" if p == RDF.type else self.term(p)
+                objs = ",\n        ".join(self.term(o) for o in objects)
+                lines.append(f"{verb} {objs}")
+                self.written += len(objects)
+            blocks.append(self.term(s) + " " + " ;\n    ".join(lines) + " .\n\n")
+        return "".join(blocks)
+
+
+WRITERS = {"nt": NTriplesWriter, "nquads": NQuadsWriter, "turtle": TurtleWriter}
+
+@contextmanager
+def open_writer(filename, format="turtle", prefixes=None):
+    try:
+        writer_class = WRITERS[format]
+    except KeyError:
+        raise NotImplementedError(f"unsupported output format '{format}'")
+    with codecs.open(filename, "w", "utf8") as fileout:
+        writer = writer_class(fileout, prefixes)
+        writer.start()
+        yield writer
+        writer.close()
@@ -0,0 +1,52 @@
+import json
+import pytest
+from terms2lod.agreement import agreement, align_documents
+
+
+def entity(i, begin, end, label="Law"):
+    return {"id": i, "label": label, "start_offset": begin, "end_offset": end}
+
+def document(i, text, entities):
+    return {"id": i, "text": text, "entities": entities, "relations": [],
+            "Comments": []}
+
+DOCS = [
+    document(1, "diritto penale", [entity(10, 0, 14)]),
+    document(2, "codice civile", [entity(11, 0, 13)]),
+    document(3, "corte di cassazione", [entity(12, 0, 19)]),
+]
+
+def export(path, docs):
+    with open(path, "w", encoding="utf8") as fileout:
+        for doc in docs:
+            fileout.write(json.dumps(doc) + "\n")
+    return path
+
+
+def test_shuffled_exports_are_aligned_by_id(tmp_path):
+    first = export(tmp_path / "annot1.jsonl", DOCS)
+    second = export(tmp_path / "annot2.jsonl", DOCS[::-1])
+    result = agreement([first, second])
+    assert result.unmatched == [[], []]
+    assert result.doc_counts.shape == (3, 1, 3)
+    assert result.corpus_f1 == pytest.approx([1.0])
+
+def test_documents_fall_back_to_text(tmp_path):
+    renumbered = [dict(d, id=d["id"] + 100) for d in DOCS]
+    first = export(tmp_path / "annot1.jsonl", DOCS)
+    second = export(tmp_path / "annot2.jsonl", renumbered[::-1])
+    unmatched = list()
+    aligned = list(align_documents([first, second], unmatched))
+    assert [(a["id"], b["id"]) for a, b in aligned] == [(1, 101), (2, 102),
+                                                        (3, 103)]
+    assert unmatched == [[], []]
+
+def test_unmatched_documents(tmp_path):
+    first = export(tmp_path / "annot1.jsonl", DOCS)
+    second = export(tmp_path / "annot2.jsonl",
+                    DOCS[:2] + [document(4, "altro testo", [])])
+    result = agreement([first, second])
+    assert result.unmatched == [[3], [4]]
+    assert result.doc_counts.shape == (2, 1, 3)
+    with pytest.raises(ValueError):
+        agreement([first, second], strict=True)
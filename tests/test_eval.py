@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from terms2lod.eval import metrics_from_relevance, bootstrap_ci, \
+    evaluate_many, relevance, extract_gold
+
+ONTOLEX = "http://www.w3.org/ns/lemon/ontolex#"
+RDF_TYPE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#type"
+
+
+def falling_precision(n=3000, seed=0):
+    #relevant candidates get rarer down the ranking
+    rng = np.random.default_rng(seed)
+    return rng.random(n) < np.clip(1 - np.arange(n) / (n / 2), 0.02, 1)
+
+@pytest.mark.parametrize("rel", [np.arange(2000) < 300, falling_precision()])
+def test_interval_contains_point_estimate(rel):
+    ks, n_actual = [50, 200, 1000], int(rel.sum() * 1.1)
+    point = metrics_from_relevance(rel, n_actual, ks)
+    low, high = bootstrap_ci(rel, n_actual, ks, n_boot=300, seed=1)
+    assert np.all(low <= point) and np.all(point <= high)
+    assert np.all(high[:, 1] <= 1)
+
+def test_repeated_draws_keep_recall_bounded():
+    gold = [f"term {i}" for i in range(10)]
+    rel = relevance(gold, gold + [f"noise {i}" for i in range(10)])
+    low, high = bootstrap_ci(rel, len(gold), [20], n_boot=500, seed=0)
+    assert high[0, 0] <= 0.8 and high[0, 1] == 1
+
+def test_same_seed_any_workers():
+    rel = falling_precision(500)
+    one = bootstrap_ci(rel, 300, [50, 100], n_boot=250, seed=3)
+    two = bootstrap_ci(rel, 300, [50, 100], n_boot=250, seed=3, workers=2)
+    assert np.array_equal(one[0], two[0]) and np.array_equal(one[1], two[1])
+
+def test_empty_candidates():
+    low, high = bootstrap_ci(relevance(["a"], []), 1, [0, 5], n_boot=10, seed=0)
+    assert not low.any() and not high.any()
+
+def write_termbase(path, n=50):
+    with open(path, "w", encoding="utf8") as fileout:
+        for i in range(n):
+            form = f"<https://example.com/form_{i}>"
+            fileout.write(f"{form} <{RDF_TYPE}> <{ONTOLEX}Form> .\n")
+            fileout.write(f'{form} <{ONTOLEX}writtenRep> "term {i}"@it .\n')
+    return path
+
+def test_evaluate_many_cutoffs_once(tmp_path, monkeypatch):
+    monkeypatch.setenv("TERMS2LOD_CACHE", str(tmp_path / "cache"))
+    termbase = write_termbase(tmp_path / "termbase.nt")
+    predicted = [f"term {i}" for i in range(100)]
+    df = evaluate_many({"system": predicted}, str(termbase))
+    assert df.index.is_unique
+    assert list(df.loc["system"].index) == [50, 100, 200, 500]
+
+def test_turtle_gold_is_streamed(tmp_path):
+    from rdflib import Graph
+    nt = write_termbase(tmp_path / "termbase.nt", 5)
+    ttl = str(tmp_path / "termbase.ttl")
+    Graph().parse(nt).serialize(ttl, format="turtle")
+    assert extract_gold(ttl) == extract_gold(str(nt)) == \
+        [f"term {i}" for i in range(5)]
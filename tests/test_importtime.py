@@ -0,0 +1,19 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "benchmarks"))
+import importtime
+
+
+@pytest.mark.parametrize("module", ["terms2lod", "terms2lod.eval", 
+                                    "terms2lod.agreement"])
+def test_heavy_dependencies_are_lazy(module):
+    times = importtime.import_times(module, repeat=1)
+    assert module in times
+    assert [m for m in importtime.LAZY if m in times] == []
+
+def test_import_budget():
+    times = importtime.import_times()
+    assert times["terms2lod"] / 1000 <= importtime.BUDGET_MS
@@ -0,0 +1,45 @@
+import pandas as pd
+import pytest
+from terms2lod.termtables import load_termtable
+
+FORMS = pd.DataFrame({"form": ["diritto", "diritti"],
+                      "lemma": ["diritto", "diritto"],
+                      "pos": ["NOUN", "NOUN"],
+                      "feats": ["Gender=Masc|Number=Sing",
+                                "Gender=Masc|Number=Plur"]})
+
+ENTRIES = pd.DataFrame({"lemma": ["diritto", "codice"], "pos": ["NOUN", "NOUN"],
+                        "feats": ["Gender=Masc|Number=Sing"] * 2,
+                        "concept": ["diritto", "codice"],
+                        "IATE": [1234567, None], "domain": ["Law", "Law"],
+                        "subterms": [None, None]})
+
+@pytest.fixture
+def tables(tmp_path, monkeypatch):
+    monkeypatch.setenv("TERMS2LOD_CACHE", str(tmp_path / "cache"))
+    forms = tmp_path / "forms.xlsx"
+    FORMS.to_excel(forms, index=False)
+    return tmp_path, str(forms)
+
+def test_numeric_column_with_blanks_is_cached(tables):
+    tmp_path, forms = tables
+    entries = str(tmp_path / "entries.xlsx")
+    ENTRIES.to_excel(entries, index=False)
+    first = load_termtable(entries, forms)
+    second = load_termtable(entries, forms)
+    assert list(first.IATE) == list(second.IATE) == ["1234567", "1234567"]
+    assert not list((tmp_path / "cache").glob("*.tmp"))
+
+@pytest.mark.parametrize("ext", [".csv", ".parquet"])
+def test_same_values_in_every_format(tables, ext):
+    tmp_path, forms = tables
+    excel, other = str(tmp_path / "entries.xlsx"), str(tmp_path / ("entries" + ext))
+    ENTRIES.to_excel(excel, index=False)
+    entries = ENTRIES.astype({"IATE": "Int64"})
+    if ext == ".csv":
+        entries.to_csv(other, index=False)
+    else:
+        ENTRIES.to_parquet(other, index=False)
+    expected = load_termtable(excel, forms).astype(object)
+    found = load_termtable(other, forms).astype(object)
+    assert expected.equals(found)